@@ -0,0 +1,196 @@
+"""instrument.py
+
+Lightweight timing and memory spans for the pipeline.
+
+    with recording() as rec:                  # collect the spans of one run
+        with span("llm", kind="convert"):
+            ...
+            annotate(input_tokens=1200)       # attach data to the open span
+        record("llm", 2.5, streamed=True)     # a span timed by the caller
+    rec.spans                                 # list of span dicts
+
+Each span records its wall time, the process id, the process's current RSS
+when it ends and the peak RSS so far, the enclosing span's name, and any
+attributes given to span() or annotate().  Spans go to the innermost active recording of the
+current context (threads need bind(), or StageGraph, to inherit it; asyncio
+tasks inherit it automatically).  Spans produced in another process can be
+shipped back as plain dicts and merged with extend().
+
+Listeners registered with add_listener() see every finished span in this
+process, recorded or not (e.g. to feed metrics).
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recording: contextvars.ContextVar = contextvars.ContextVar("instrument_recording", default=None)
+_stack: contextvars.ContextVar = contextvars.ContextVar("instrument_stack", default=())
+_listeners: list = []
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def rss_mb() -> float | None:
+    """Current resident set size in MB (Linux), else None."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * _PAGE_SIZE / (1024 * 1024), 1)
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process so far in MB, else None.
+    Never decreases, so in a long-lived process it covers earlier work too."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Recording:
+    """Spans collected by recording(); safe to append to from several threads."""
+
+    def __init__(self):
+        self.t0 = time.time()
+        self._spans: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> None:
+        with self._lock:
+            self._spans.append(entry)
+
+    @property
+    def raw(self) -> list[dict]:
+        """Spans with absolute 'ts' timestamps, for extend() elsewhere."""
+        with self._lock:
+            return list(self._spans)
+
+    @property
+    def spans(self) -> list[dict]:
+        """Spans in start order, with 'start' as seconds since the recording began."""
+        spans = []
+        for entry in sorted(self.raw, key=lambda e: e["ts"]):
+            entry = dict(entry)
+            entry["start"] = round(entry.pop("ts") - self.t0, 3)
+            spans.append(entry)
+        return spans
+
+    def summary(self) -> dict:
+        """Per span name: count, total seconds and highest peak RSS."""
+        totals: dict[str, dict] = {}
+        for entry in self.raw:
+            t = totals.setdefault(entry["name"], {"count": 0, "seconds": 0.0, "peak_rss_mb": None})
+            t["count"] += 1
+            t["seconds"] = round(t["seconds"] + entry["seconds"], 3)
+            if entry.get("peak_rss_mb") is not None:
+                t["peak_rss_mb"] = max(t["peak_rss_mb"] or 0.0, entry["peak_rss_mb"])
+        return totals
+
+
+@contextmanager
+def recording():
+    """Collect the spans finished in this context (and contexts bound to
+    it) until the block exits."""
+    rec = Recording()
+    token = _recording.set(rec)
+    try:
+        yield rec
+    finally:
+        _recording.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a span named `name`.  Yields the span's attribute
+    dict; annotate() adds to it from deeper in the call stack."""
+    stack = _stack.get()
+    entry = {"name": name, "ts": time.time(), "parent": stack[-1]["name"] if stack else None, **attrs}
+    token = _stack.set(stack + (entry,))
+    t0 = time.monotonic()
+    try:
+        yield entry
+    except BaseException as e:
+        entry["error"] = type(e).__name__
+        raise
+    finally:
+        _stack.reset(token)
+        entry["seconds"] = round(time.monotonic() - t0, 4)
+        _finish(entry)
+
+
+def record(name: str, seconds: float, **attrs) -> dict:
+    """Record a span that has just ended after `seconds`.  For work that
+    cannot sit inside a with-block, e.g. a generator that yields while the
+    call is in flight."""
+    stack = _stack.get()
+    entry = {
+        "name": name, "ts": time.time() - seconds, "parent": stack[-1]["name"] if stack else None,
+        **attrs, "seconds": round(seconds, 4),
+    }
+    _finish(entry)
+    return entry
+
+
+def _finish(entry: dict) -> None:
+    entry["pid"] = os.getpid()
+    entry["rss_mb"] = rss_mb()
+    entry["peak_rss_mb"] = peak_rss_mb()
+    rec = _recording.get()
+    if rec is not None:
+        rec.add(entry)
+    for listener in list(_listeners):
+        try:
+            listener(entry)
+        except Exception:
+            pass
+
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span, if any."""
+    stack = _stack.get()
+    if stack:
+        stack[-1].update(attrs)
+
+
+def extend(entries: list) -> None:
+    """Merge spans from elsewhere (e.g. Recording.raw from a worker process)
+    into the current recording.  Listeners are not called again."""
+    rec = _recording.get()
+    if rec is not None:
+        for entry in entries:
+            rec.add(entry)
+
+
+def bind(fn):
+    """Wrap fn to run in a copy of the current context, so spans it records
+    from a pool thread reach the caller's recording."""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def add_listener(fn) -> None:
+    """Call fn(span_dict) for every span finished in this process."""
+    _listeners.append(fn)
+
+
+def remove_listener(fn) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
@@ -0,0 +1,434 @@
+"""llm_backend.py
+
+Pluggable LLM backends for run_batch.py and the FastAPI app.
+
+    LLM_BACKEND=openai   the OpenAI API (default)
+    LLM_BACKEND=replay   recorded responses from output/<stem>/ artifacts
+    LLM_BACKEND=fake     synthetic responses built from the prompt
+
+make_client() / make_async_client() return a client for the configured
+backend.  The replay and fake clients make no network calls and need no API
+key: they implement the part of the OpenAI client the pipeline uses
+(responses.create, plain and streamed; chat.completions.create for the
+vision fallback; models.list) and simulate latency, so the batch runner and
+the service can be load-tested at realistic concurrency for free.
+
+Environment (replay and fake):
+    LLM_FAKE_LATENCY      total response time (default: fixed:0)
+    LLM_FAKE_TTFT         time to the first streamed delta (default: 10% of the total)
+    LLM_FAKE_ERROR_RATE   fraction of calls failing with APIConnectionError (default: 0)
+    LLM_FAKE_SEED         random seed, for repeatable runs
+    LLM_REPLAY_DIR        recordings for replay (default: output/ in the repo)
+
+Latencies are distributions in seconds: "fixed:S", "uniform:LO,HI",
+"normal:MEAN,SD", "lognormal:MEDIAN,SIGMA" or "exp:MEAN" (draws below zero
+count as zero).
+
+Replay matches a prompt to the recording whose cleaned.txt it quotes and
+answers conversion prompts with the recorded model output
+(model_output_debug.txt, else protocol.md without its Review Flags) — the
+matching slice of it for one part of a chunked document — and flagging
+prompts with flags.md.  Prompts no recording matches get the fake answer.
+
+Reported usage includes input_tokens_details.cached_tokens, simulating the
+API's prompt cache: the longest prefix of 1024+ tokens (in 128-token steps)
+already sent in an earlier prompt of this process counts as cached.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+from openai import APIConnectionError, AsyncOpenAI, OpenAI
+
+from rate_limit import estimate_tokens
+
+BACKENDS = ("openai", "replay", "fake")
+DEFAULT_REPLAY_DIR = Path(__file__).resolve().parent / "output"
+
+# Streamed responses are cut into at most this many deltas
+_MAX_DELTAS = 200
+
+
+def backend_name() -> str:
+    name = os.getenv("LLM_BACKEND", "openai").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
+    return name
+
+
+def make_client(**openai_kwargs):
+    """Sync client for the configured backend; openai_kwargs go to OpenAI()."""
+    name = backend_name()
+    if name == "openai":
+        return OpenAI(**openai_kwargs)
+    return FakeClient(_make_responder(name), _Timing.from_env())
+
+
+def make_async_client(**openai_kwargs):
+    """Async client for the configured backend; openai_kwargs go to AsyncOpenAI()."""
+    name = backend_name()
+    if name == "openai":
+        return AsyncOpenAI(**openai_kwargs)
+    return AsyncFakeClient(_make_responder(name), _Timing.from_env())
+
+
+# -------------------------
+# Latency
+# -------------------------
+def parse_distribution(spec: str, rng: random.Random):
+    """Return a function sampling seconds from a distribution spec (see module doc)."""
+    kind, _, args = spec.strip().partition(":")
+    try:
+        params = [float(a) for a in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"Bad latency spec '{spec}'") from None
+    kind = kind.lower()
+    samplers = {
+        "fixed": (1, lambda s: s),
+        "uniform": (2, lambda lo, hi: rng.uniform(lo, hi)),
+        "normal": (2, lambda mean, sd: rng.gauss(mean, sd)),
+        "lognormal": (2, lambda median, sigma: rng.lognormvariate(math.log(median), sigma)),
+        "exp": (1, lambda mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+    }
+    if kind not in samplers or len(params) != samplers[kind][0]:
+        raise ValueError(f"Bad latency spec '{spec}'")
+    sample = samplers[kind][1]
+    return lambda: max(0.0, sample(*params))
+
+
+class _Timing:
+    """Latency and error injection shared by a fake client's calls."""
+
+    def __init__(self, latency: str = "fixed:0", ttft: str = None, error_rate: float = 0.0, seed=None):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latency = parse_distribution(latency, self._rng)
+        self._ttft = parse_distribution(ttft, self._rng) if ttft else None
+        self.error_rate = error_rate
+
+    @classmethod
+    def from_env(cls) -> "_Timing":
+        seed = os.getenv("LLM_FAKE_SEED")
+        return cls(
+            latency=os.getenv("LLM_FAKE_LATENCY", "fixed:0"),
+            ttft=os.getenv("LLM_FAKE_TTFT") or None,
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+    def draw(self) -> tuple[float, float, bool]:
+        """(total seconds, seconds to first delta, fail?) for one call."""
+        with self._lock:
+            total = self._latency()
+            ttft = min(total, self._ttft()) if self._ttft else total * 0.1
+            fail = self._rng.random() < self.error_rate
+        return total, ttft, fail
+
+
+def _connection_error() -> APIConnectionError:
+    return APIConnectionError(
+        message="Simulated connection error (LLM_FAKE_ERROR_RATE)",
+        request=httpx.Request("POST", "https://fake-llm.invalid/v1"),
+    )
+
+
+def _deltas(text: str) -> list[str]:
+    size = max(16, -(-len(text) // _MAX_DELTAS))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+# -------------------------
+# Responses
+# -------------------------
+_PART_RE = re.compile(r"part (\d+) of (\d+) of a longer document")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_FAKE_FLAGS = """## Critical Parameters Checklist (from the protocol)
+- [CHECK] Synthetic response: parameters not reviewed
+
+## Potential Missing Parameters (compare to source)
+- None detected
+
+## Possible Unsupported Claims
+- None detected
+
+## Step Order / Omission Risks
+- None detected"""
+
+_FAKE_VISION = "No tables found."
+
+
+def _prompt_source(prompt: str) -> str:
+    """The document text quoted in a conversion or flagging prompt."""
+    if "--- INPUT TEXT ---" in prompt:
+        return prompt.split("--- INPUT TEXT ---", 1)[1]
+    if "--- SOURCE TEXT ---" in prompt:
+        return prompt.split("--- SOURCE TEXT ---", 1)[1].split("--- GENERATED PROTOCOL ---", 1)[0]
+    return prompt
+
+
+def _prompt_part(prompt: str) -> tuple[int, int] | None:
+    m = _PART_RE.search(prompt)
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+
+def _prompt_kind(prompt: str) -> str:
+    if "--- CONTRACT ---" in prompt:
+        return "convert"
+    if "--- GENERATED PROTOCOL ---" in prompt:
+        return "flag"
+    return "other"
+
+
+def fake_protocol(source: str, part: tuple[int, int] = None) -> str:
+    """A protocol-shaped answer built from the source text: its sentences as
+    numbered steps, five per section."""
+    sentences = [s.strip() for s in _SENTENCE_RE.split(source.strip()) if s.strip()][:400]
+    lines = ["# Synthetic Protocol"] if part is None or part[0] == 1 else []
+    for i, sentence in enumerate(sentences):
+        if i % 5 == 0:
+            section = i // 5 + 1
+            lines += ["", f"## Section {section}" if part is None else f"## Part {part[0]} Section {section}", ""]
+        lines.append(f"{i % 5 + 1}. {sentence[:300]}")
+    return "\n".join(lines).strip()
+
+
+class FakeResponder:
+    """Synthetic answers derived from the prompt."""
+
+    def respond(self, prompt: str) -> str:
+        kind = _prompt_kind(prompt)
+        if kind == "flag":
+            return _FAKE_FLAGS
+        return fake_protocol(_prompt_source(prompt), _prompt_part(prompt))
+
+    def respond_vision(self, messages: list) -> str:
+        return _FAKE_VISION
+
+
+def _slice_part(text: str, index: int, count: int) -> str:
+    """Roughly the index-th of count contiguous parts of text, cut at headings."""
+    lines = text.split("\n")
+    starts = [i for i, line in enumerate(lines) if line.startswith("#")] or [0]
+    bounds = [0]
+    for k in range(1, count):
+        target = len(lines) * k // count
+        # Next heading at or after the even split point
+        bounds.append(next((s for s in starts if s >= target and s > bounds[-1]), len(lines)))
+    bounds.append(len(lines))
+    return "\n".join(lines[bounds[index - 1]:bounds[index]]).strip()
+
+
+class ReplayResponder(FakeResponder):
+    """Recorded answers from output/<stem>/ artifacts."""
+
+    SNIPPET = 80
+    MAX_SNIPPETS = 50
+
+    def __init__(self, replay_dir: Path):
+        self.recordings = []
+        for cleaned_path in sorted(Path(replay_dir).glob("*/cleaned.txt")):
+            out_dir = cleaned_path.parent
+            cleaned = cleaned_path.read_text(encoding="utf-8")
+            debug_path, protocol_path = out_dir / "model_output_debug.txt", out_dir / "protocol.md"
+            if debug_path.exists():
+                protocol = debug_path.read_text(encoding="utf-8")
+            elif protocol_path.exists():
+                protocol = protocol_path.read_text(encoding="utf-8").split("## Review Flags", 1)[0]
+            else:
+                continue
+            flags_path = out_dir / "flags.md"
+            self.recordings.append({
+                "name": out_dir.name,
+                "snippets": self._snippets(cleaned),
+                "protocol": protocol.strip(),
+                "flags": flags_path.read_text(encoding="utf-8").strip() if flags_path.exists() else None,
+            })
+
+    def _snippets(self, text: str) -> list[str]:
+        step = max(self.SNIPPET * 2, len(text) // self.MAX_SNIPPETS)
+        snippets = (text[i:i + self.SNIPPET] for i in range(0, max(1, len(text) - self.SNIPPET), step))
+        return [s for s in snippets if len(s.strip()) >= self.SNIPPET // 2]
+
+    def match(self, source: str) -> dict | None:
+        """The recording whose cleaned text the source quotes most."""
+        best, best_hits = None, 0
+        for rec in self.recordings:
+            hits = sum(1 for s in rec["snippets"] if s in source)
+            if hits > best_hits:
+                best, best_hits = rec, hits
+        return best
+
+    def respond(self, prompt: str) -> str:
+        kind = _prompt_kind(prompt)
+        rec = self.match(_prompt_source(prompt)) if kind != "other" else None
+        if rec is None or (kind == "flag" and rec["flags"] is None):
+            return super().respond(prompt)
+        if kind == "flag":
+            return rec["flags"]
+        part = _prompt_part(prompt)
+        return _slice_part(rec["protocol"], *part) if part else rec["protocol"]
+
+
+_responders: dict = {}
+_responders_lock = threading.Lock()
+
+
+def _make_responder(name: str):
+    """One responder per backend and replay directory (the replay index is
+    built once per process)."""
+    key = (name, os.getenv("LLM_REPLAY_DIR", str(DEFAULT_REPLAY_DIR)))
+    with _responders_lock:
+        if key not in _responders:
+            _responders[key] = ReplayResponder(Path(key[1])) if name == "replay" else FakeResponder()
+        return _responders[key]
+
+
+# -------------------------
+# Simulated prompt cache
+# -------------------------
+class _PromptCache:
+    """Prefix hashes of the prompts seen so far, at the cache's token steps
+    (tokens counted as estimate_tokens does, 4 characters each)."""
+
+    MIN_TOKENS = 1024
+    STEP_TOKENS = 128
+    MAX_ENTRIES = 100_000
+
+    def __init__(self):
+        self._seen: set = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, prompt: str) -> int:
+        """Tokens of prompt's longest previously seen prefix; records its prefixes."""
+        h = hashlib.sha1()
+        pos = 0
+        steps = []
+        for tokens in range(self.MIN_TOKENS, estimate_tokens(prompt) + 1, self.STEP_TOKENS):
+            h.update(prompt[pos:tokens * 4].encode("utf-8"))
+            pos = tokens * 4
+            steps.append((tokens, h.digest()))
+        with self._lock:
+            cached = max((tokens for tokens, key in steps if key in self._seen), default=0)
+            if len(self._seen) > self.MAX_ENTRIES:
+                self._seen.clear()
+            self._seen.update(key for _, key in steps)
+        return cached
+
+
+_prompt_cache = _PromptCache()
+
+
+# -------------------------
+# Client objects
+# -------------------------
+def _usage(prompt: str, text: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        input_tokens=estimate_tokens(prompt),
+        output_tokens=estimate_tokens(text),
+        input_tokens_details=SimpleNamespace(cached_tokens=_prompt_cache.cached_tokens(prompt)),
+    )
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        # Vision messages: text parts only (images are counted by the caller)
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+    return str(content)
+
+
+def _chat_response(messages: list, text: str) -> SimpleNamespace:
+    prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(text))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+class _FakeClientBase:
+    def __init__(self, responder, timing: _Timing):
+        self._responder = responder
+        self._timing = timing
+        self.responses = SimpleNamespace(create=self._create)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.models = SimpleNamespace(list=lambda: SimpleNamespace(data=[]))
+
+
+class FakeClient(_FakeClientBase):
+    """Sync stand-in for openai.OpenAI."""
+
+    def _create(self, model: str, input: str, stream: bool = False, **kwargs):
+        total, ttft, fail = self._timing.draw()
+        text = self._responder.respond(input)
+        if fail:
+            time.sleep(ttft)
+            raise _connection_error()
+        if not stream:
+            time.sleep(total)
+            return SimpleNamespace(output_text=text, usage=_usage(input, text))
+        return self._stream(input, text, total, ttft)
+
+    @staticmethod
+    def _stream(prompt: str, text: str, total: float, ttft: float):
+        deltas = _deltas(text)
+        gap = (total - ttft) / len(deltas)
+        time.sleep(ttft)
+        for i, delta in enumerate(deltas):
+            if i:
+                time.sleep(gap)
+            yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        yield SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=_usage(prompt, text)))
+
+    def _chat_create(self, model: str, messages: list, **kwargs):
+        total, _, fail = self._timing.draw()
+        time.sleep(total)
+        if fail:
+            raise _connection_error()
+        return _chat_response(messages, self._responder.respond_vision(messages))
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncFakeClient(_FakeClientBase):
+    """Async stand-in for openai.AsyncOpenAI."""
+
+    async def _create(self, model: str, input: str, stream: bool = False, **kwargs):
+        total, ttft, fail = self._timing.draw()
+        text = self._responder.respond(input)
+        if fail:
+            await asyncio.sleep(ttft)
+            raise _connection_error()
+        if not stream:
+            await asyncio.sleep(total)
+            return SimpleNamespace(output_text=text, usage=_usage(input, text))
+        return self._stream(input, text, total, ttft)
+
+    @staticmethod
+    async def _stream(prompt: str, text: str, total: float, ttft: float):
+        deltas = _deltas(text)
+        gap = (total - ttft) / len(deltas)
+        await asyncio.sleep(ttft)
+        for i, delta in enumerate(deltas):
+            if i:
+                await asyncio.sleep(gap)
+            yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        yield SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=_usage(prompt, text)))
+
+    async def _chat_create(self, model: str, messages: list, **kwargs):
+        total, _, fail = self._timing.draw()
+        await asyncio.sleep(total)
+        if fail:
+            raise _connection_error()
+        return _chat_response(messages, self._responder.respond_vision(messages))
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,152 @@
+"""llm_cache.py
+
+Content-addressed cache for LLM results.
+
+Keys are SHA-256 hashes over everything that determines a response (model,
+prompt template version, contract text, input text, ...), so a re-upload of
+the same vendor PDF or a re-run of a batch after a DOCX-only change is served
+from disk instead of the API.
+
+Storage is a single SQLite file.  Entries are evicted least-recently-used
+once the total stored size exceeds the configured limit.  Hit/miss counters
+are kept per process.
+
+A second cache, get_vision_cache(), holds vision-fallback table results
+keyed by page fingerprint, in its own file.
+
+Environment:
+    LLM_CACHE            set to "0"/"off" to disable (default: enabled)
+    LLM_CACHE_PATH       SQLite file (default: <repo>/.cache/llm_cache.sqlite3)
+    LLM_CACHE_MAX_MB     size limit before LRU eviction (default: 256)
+    VISION_CACHE, VISION_CACHE_PATH, VISION_CACHE_MAX_MB
+                         the same for the vision cache
+                         (default: <repo>/.cache/vision_cache.sqlite3, 64 MB)
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "llm_cache.sqlite3"
+DEFAULT_MAX_MB = 256
+DEFAULT_VISION_CACHE_PATH = Path(__file__).parent / ".cache" / "vision_cache.sqlite3"
+DEFAULT_VISION_MAX_MB = 64
+
+
+def cache_key(*parts) -> str:
+    """Hash the given parts into a cache key.
+
+    Each part is length-prefixed so ("ab", "c") and ("a", "bc") differ.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        data = str(part).encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU cache of text values in SQLite, safe across threads."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> str | None:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least-recently-used entries until the total size fits."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def _cache_from_env(prefix: str, default_path: Path, default_max_mb: int) -> ResultCache | None:
+    """Return the process-wide cache configured by <prefix>, <prefix>_PATH
+    and <prefix>_MAX_MB, or None when it is disabled."""
+    if os.getenv(prefix, "1").strip().lower() in ("0", "off", "false", "no"):
+        return None
+    with _caches_lock:
+        if prefix not in _caches:
+            try:
+                max_mb = float(os.getenv(f"{prefix}_MAX_MB", default_max_mb))
+            except ValueError:
+                max_mb = default_max_mb
+            path = Path(os.getenv(f"{prefix}_PATH", str(default_path)))
+            _caches[prefix] = ResultCache(path, int(max_mb * 1024 * 1024))
+        return _caches[prefix]
+
+
+def get_llm_cache() -> ResultCache | None:
+    """Return the process-wide cache configured from the environment, or None
+    when caching is disabled."""
+    return _cache_from_env("LLM_CACHE", DEFAULT_CACHE_PATH, DEFAULT_MAX_MB)
+
+
+def get_vision_cache() -> ResultCache | None:
+    """Return the process-wide vision result cache, or None when disabled."""
+    return _cache_from_env("VISION_CACHE", DEFAULT_VISION_CACHE_PATH, DEFAULT_VISION_MAX_MB)
@@ -1,15 +1,24 @@
+import asyncio
+import io
+import json
 import logging
 import os
 import re
 import tempfile
+import time
 import shutil
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from starlette.background import BackgroundTask
+import httpx
+from openai import AsyncOpenAI
+from python_multipart.multipart import MultipartParser, parse_options_header
 from dotenv import load_dotenv
 
 logging.basicConfig(level=logging.INFO)
@@ -18,24 +27,102 @@ logger = logging.getLogger(__name__)
 # Import existing pipeline functions
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
 from run_batch import (
+    STRIP_BOILERPLATE,
+    TABLE_PLACEHOLDERS,
     extract_text_from_pdf,
+    extract_pdf_content,
     clean_text,
-    convert_to_protocol_markdown,
+    clean_text_preserving_placeholders,
+    strip_page_boilerplate,
+    resolve_table_placeholders,
+    split_source_chunks,
+    aconvert_chunks_stream,
     finalize_protocol_md,
-    generate_flags_md,
-    append_flags_summary
+    agenerate_chunked_flags_md,
+    append_flags_summary,
+    aiter_completed_lines,
+    normalize_user_facing_labels,
 )
+import instrument
+from llm_backend import backend_name, make_async_client
+from stage_graph import StageError, StageGraph
+from executor import PipelineExecutor, ServerBusy
+from jobs import JobEvents, make_job_store, new_job
+import metrics
 
 load_dotenv()
 
-app = FastAPI()
+# CPU-bound stages go to a process pool, LLM calls to a thread pool; see executor.py
+executor = PipelineExecutor()
+job_store = make_job_store()
+job_events = JobEvents()
+
+# One AsyncOpenAI client for the application's lifetime (created in lifespan),
+# so requests share pooled keep-alive connections instead of each opening its own
+llm_client: AsyncOpenAI | None = None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))
+
+
+def _make_llm_client() -> AsyncOpenAI | None:
+    """Create the shared AsyncOpenAI client, or None without an API key.
+    With LLM_BACKEND=replay or fake, an offline stand-in (see llm_backend.py)."""
+    if backend_name() != "openai":
+        return make_async_client()
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        return None
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=60,
+        ),
+        # Long generations stream for minutes; connecting should not
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+    )
+    return make_async_client(api_key=api_key, http_client=http_client)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global llm_client
+    interrupted = job_store.mark_interrupted()
+    if interrupted:
+        logger.warning(f"[{datetime.now()}] Marked {interrupted} unfinished job(s) from a previous run as failed")
+    pruned = job_store.prune()
+    if pruned:
+        logger.info(f"[{datetime.now()}] Deleted {pruned} finished job(s) past their retention")
+    orphans = _remove_orphan_temp_dirs()
+    if orphans:
+        logger.warning(f"[{datetime.now()}] Removed {orphans} temp directories left by a previous run")
+    executor.start()
+    llm_client = _make_llm_client()
+    try:
+        yield
+    finally:
+        if llm_client is not None:
+            await llm_client.close()
+            llm_client = None
+        executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/health")
 def health():
     logger.info("Health check pinged")
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics (see metrics.py)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # CORS: allow Next.js frontend in dev and production
 # Set EXTRA_CORS_ORIGINS env var for additional origins (comma-separated)
 _origins = [
@@ -56,6 +143,11 @@ app.add_middleware(
 )
 
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
+# Per-request scratch directories (holding the uploaded PDF) are named
+# protocol-<pid>-*, so the startup janitor can tell orphans from live ones
+TEMP_DIR_PREFIX = "protocol-"
+# Processes used to extract page ranges of one PDF in parallel (see run_batch.extract_pdf_content)
+PAGE_WORKERS = max(1, int(os.getenv("PDF_PAGE_WORKERS", "1")))
 
 
 def _get_or_create_restart_num_id(doc):
@@ -232,48 +324,57 @@ def _split_table_blocks(table_lines: list) -> list:
     return blocks
 
 
-def markdown_to_docx(md_content: str, output_path: Path, pdf_tables: list = None):
-    """Convert markdown to docx using python-docx.
+class _DocxBuilder:
+    """Incremental markdown → DOCX renderer behind markdown_to_docx.
 
-    pdf_tables – ordered list of raw table dicts from extract_tables_from_pdf().
-    When present, TABLE_PLACEHOLDER_N lines are replaced with the corresponding
-    pre-extracted table rendered directly from pdfplumber row data.
+    Lines can be fed one at a time as they become available (e.g. while the
+    model is still streaming), so by the time the last line arrives the
+    document is already built and only needs saving.  With pdf_tables, a
+    TABLE_PLACEHOLDER_N line is rendered as table N's extracted rows.
     """
-    from docx import Document
 
-    doc = Document()
-    lines = md_content.split('\n')
-    i = 0
-    # Tracks whether the next numbered-list paragraph should restart at 1.
-    _restart_next_list = False
-    # The numId currently in use for the active section's numbered list.
-    _section_num_id = None
+    def __init__(self, pdf_tables: list = None):
+        from docx import Document
 
-    while i < len(lines):
-        line = lines[i]
+        self.doc = Document()
+        self.pdf_tables = pdf_tables
+        # Tracks whether the next numbered-list paragraph should restart at 1.
+        self._restart_next_list = False
+        # The numId currently in use for the active section's numbered list.
+        self._section_num_id = None
+
+    def add_line(self, line: str) -> None:
+        doc = self.doc
 
         # Skip empty lines
         if not line.strip():
-            i += 1
-            continue
+            return
+
+        # Table placeholder — render the pre-extracted table; unknown ones are dropped
+        m = re.match(r'^TABLE_PLACEHOLDER_(\d+)$', line.strip())
+        if m and self.pdf_tables is not None:
+            idx = int(m.group(1)) - 1
+            if 0 <= idx < len(self.pdf_tables):
+                _add_raw_table_to_doc(doc, self.pdf_tables[idx]["rows"])
+            return
 
         # Handle headings — each heading marks the start of a new list sequence
         if line.startswith('# '):
             doc.add_heading(line[2:], level=1)
-            _restart_next_list = True
-            _section_num_id = None
+            self._restart_next_list = True
+            self._section_num_id = None
         elif line.startswith('## '):
             doc.add_heading(line[3:], level=2)
-            _restart_next_list = True
-            _section_num_id = None
+            self._restart_next_list = True
+            self._section_num_id = None
         elif line.startswith('### '):
             doc.add_heading(line[4:], level=3)
-            _restart_next_list = True
-            _section_num_id = None
+            self._restart_next_list = True
+            self._section_num_id = None
         elif line.startswith('#### '):
             doc.add_heading(line[5:], level=4)
-            _restart_next_list = True
-            _section_num_id = None
+            self._restart_next_list = True
+            self._section_num_id = None
 
         # Handle bullet lists
         elif line.strip().startswith('- ') or line.strip().startswith('* '):
@@ -287,95 +388,532 @@ def markdown_to_docx(md_content: str, output_path: Path, pdf_tables: list = None
             para = doc.add_paragraph(text, style='List Number')
             # First numbered item after a heading: create a fresh numbering
             # sequence so this section restarts at 1.
-            if _restart_next_list:
+            if self._restart_next_list:
                 new_id = _get_or_create_restart_num_id(doc)
                 if new_id:
-                    _section_num_id = new_id
-                _restart_next_list = False
+                    self._section_num_id = new_id
+                self._restart_next_list = False
             # Pin every item in this section to the same numId so the counter
             # is continuous within the section and isolated from other sections.
-            if _section_num_id:
-                _apply_num_id_to_para(para, _section_num_id)
+            if self._section_num_id:
+                _apply_num_id_to_para(para, self._section_num_id)
 
         # Regular paragraph
         else:
             doc.add_paragraph(line)
 
-        i += 1
+    def add_lines(self, lines: list[str]) -> None:
+        for line in lines:
+            self.add_line(line)
 
-    doc.save(str(output_path))
+    def save(self, output_path: Path) -> None:
+        self.doc.save(str(output_path))
 
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        self.doc.save(buffer)
+        return buffer.getvalue()
 
-@app.post("/convert")
-async def convert_pdf(file: UploadFile = File(...)):
+
+def markdown_to_docx(md_content: str, output_path: Path, pdf_tables: list = None):
+    """Convert markdown to docx using python-docx.
+
+    pdf_tables – ordered list of raw table dicts from extract_tables_from_pdf().
+    When present, TABLE_PLACEHOLDER_N lines are replaced with the corresponding
+    pre-extracted table rendered directly from pdfplumber row data.
     """
-    Convert uploaded PDF to protocol DOCX.
+    builder = _DocxBuilder(pdf_tables)
+    for line in md_content.split('\n'):
+        builder.add_line(line)
+    builder.save(output_path)
+
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _docx_response(data: bytes, filename: str, background: BackgroundTask = None) -> StreamingResponse:
+    """Stream in-memory DOCX bytes as an attachment, in 64 KB chunks."""
+    buffer = io.BytesIO(data)
+    return StreamingResponse(
+        iter(partial(buffer.read, 64 * 1024), b""),
+        media_type=DOCX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(len(data)),
+        },
+        background=background,
+    )
+
+
+class _StageFailed(Exception):
+    """Wraps an exception raised inside a pipeline stage, recording which one."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def _publish(job_id: str | None, event: str, **data) -> None:
+    """Publish a progress event for a job; a no-op for synchronous /convert."""
+    if job_id:
+        job_events.publish(job_id, event, **data)
+
+
+@asynccontextmanager
+async def _track_stage(job_id: str | None, stage: str):
+    """Record stage start/end timing on the job (if any), publish stage
+    events and tag failures.  The stage also runs in an instrumentation span
+    (for /metrics)."""
+    if job_id:
+        await executor.run_io(job_store.start_stage, job_id, stage)
+        _publish(job_id, "stage", stage=stage, state="started")
+    t0 = time.monotonic()
+    try:
+        with instrument.span(f"stage.{stage}"):
+            yield
+    except Exception as e:
+        raise _StageFailed(stage, e) from e
+    finally:
+        if job_id:
+            await executor.run_io(job_store.end_stage, job_id, stage)
+            _publish(job_id, "stage", stage=stage, state="finished", seconds=round(time.monotonic() - t0, 3))
+
+
+async def _stream_protocol(client: AsyncOpenAI, contract: str, chunks: list[str], builder: _DocxBuilder, on_line=None) -> tuple[str, str, list]:
+    """Stream the conversion and render completed lines into builder as they
+    arrive.
+
+    The python-docx work runs on the I/O pool, one batch at a time: lines
+    that arrive while a batch is rendering make up the next batch, so the
+    event loop only collects lines.
+
+    Returns (protocol_md, fed_md, parts): the finalized protocol markdown (as
+    finalize_protocol_md would produce from the full response), the markdown
+    already rendered into builder, for _finish_docx, and the per-chunk
+    outputs for flagging.
     """
-    # Validate file type
-    if not file.filename or not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
-    # Read file content
-    file_content = await file.read()
-    
-    # Validate file size
-    if len(file_content) > MAX_FILE_SIZE:
+    parts: list[str] = []
+    lines: list[str] = []
+    pending: list[str] = []
+    render = None  # the batch being rendered into builder, if any
+    try:
+        async for line in aiter_completed_lines(aconvert_chunks_stream(client, contract, chunks, parts)):
+            if not lines:
+                # Match the .strip() applied to the full response
+                line = line.lstrip()
+                if not line:
+                    continue
+            lines.append(line)
+            pending.append(normalize_user_facing_labels(line))
+            if on_line is not None:
+                on_line(line)
+            if render is None or render.done():
+                if render is not None:
+                    render.result()  # raise if rendering failed
+                render = asyncio.ensure_future(executor.run_io(builder.add_lines, pending))
+                pending = []
+    except BaseException:
+        if render is not None:
+            # The builder is abandoned; don't leave the batch's outcome unretrieved
+            render.cancel()
+        raise
+    if render is not None:
+        await render
+    if pending:
+        await executor.run_io(builder.add_lines, pending)
+    protocol_md = "\n".join(lines)
+    if builder.pdf_tables is not None:
+        # Placeholders the model dropped or mangled; if this changes the
+        # markdown, _finish_docx re-renders it in full
+        protocol_md = resolve_table_placeholders(protocol_md, builder.pdf_tables)
+    protocol_md = finalize_protocol_md(protocol_md)
+    fed_md = "\n".join(normalize_user_facing_labels(line) for line in lines).rstrip()
+    return protocol_md, fed_md, parts
+
+
+def _finish_docx(builder: _DocxBuilder, final_md: str, fed_md: str) -> bytes:
+    """Blocking: render the part of final_md not yet fed to builder (review
+    checklist, flags) and return the DOCX bytes.  Falls back to a full render
+    if final_md does not extend what was streamed."""
+    if not final_md.startswith(fed_md):
+        builder, fed_md = _DocxBuilder(builder.pdf_tables), ""
+    for line in final_md[len(fed_md):].split('\n'):
+        builder.add_line(line)
+    return builder.to_bytes()
+
+
+def _save_draft(builder: _DocxBuilder, job_id: str) -> int:
+    """Blocking: store the DOCX rendered so far (the protocol without review
+    flags) as the job's draft result.  Returns its size in bytes."""
+    data = builder.to_bytes()
+    job_store.put_result(job_id, data, draft=True)
+    return len(data)
+
+
+async def _run_pipeline(pdf_path: Path, client: AsyncOpenAI, contract: str, job_id: str = None) -> bytes:
+    """Run extract → clean → convert → flag → docx and return the DOCX bytes.
+
+    The stages form a StageGraph.  LLM calls go through the shared async
+    client; other blocking work is dispatched off the event loop via the
+    executor.  The conversion is streamed: DOCX rendering
+    consumes completed lines while the model is still writing.  Once it
+    ends, the flagging pass runs concurrently with persisting a flags-free
+    draft of the DOCX (jobs only), and the final DOCX only needs the flags
+    section appended.  When job_id is given, stage timings are stored on the
+    job and progress events (including each streamed line) are published to
+    job_events.
+    """
+    builder = _DocxBuilder()
+    on_line = (lambda line: _publish(job_id, "line", text=line)) if job_id else None
+
+    async def _extract(r):
+        async with _track_stage(job_id, "extract"):
+            if TABLE_PLACEHOLDERS:
+                # Tables leave the text as TABLE_PLACEHOLDER_N lines (no vision fallback here)
+                raw_text, builder.pdf_tables = await executor.run_cpu(extract_pdf_content, pdf_path, None, True, PAGE_WORKERS, True)
+                _publish(job_id, "extracted", pages=raw_text.count("--- PAGE "), chars=len(raw_text), tables=len(builder.pdf_tables))
+            else:
+                raw_text = await executor.run_cpu(extract_text_from_pdf, pdf_path, None, PAGE_WORKERS)
+                _publish(job_id, "extracted", pages=raw_text.count("--- PAGE "), chars=len(raw_text))
+            return raw_text
+
+    async def _clean(r):
+        async with _track_stage(job_id, "clean"):
+            text, removed = r["extract"], None
+            if STRIP_BOILERPLATE:
+                # Running headers/footers and page markers (see run_batch.strip_page_boilerplate)
+                text, removed = await executor.run_cpu(strip_page_boilerplate, text)
+                logger.info(
+                    f"[{datetime.now()}] Stripped {removed['lines']} boilerplate lines "
+                    f"({removed['chars']} chars) before cleaning{f' for job {job_id}' if job_id else ''}"
+                )
+            cleaner = clean_text_preserving_placeholders if TABLE_PLACEHOLDERS else clean_text
+            cleaned_text = await executor.run_cpu(cleaner, text)
+            # Long documents are converted section-wise in parallel chunks
+            chunks = await executor.run_cpu(split_source_chunks, text, cleaned_text)
+            _publish(
+                job_id, "cleaned", chars=len(cleaned_text), chunks=len(chunks),
+                boilerplate_chars=removed["chars"] if removed else 0,
+            )
+            return chunks
+
+    async def _convert(r):
+        async with _track_stage(job_id, "convert"):
+            protocol_md, fed_md, parts = await _stream_protocol(client, contract, r["clean"], builder, on_line)
+            _publish(job_id, "converted", chars=len(protocol_md))
+            return protocol_md, fed_md, parts
+
+    async def _flag(r):
+        protocol_md, _, parts = r["convert"]
+        async with _track_stage(job_id, "flag"):
+            flags_md = await agenerate_chunked_flags_md(client, r["clean"], parts, protocol_md)
+            _publish(job_id, "flagged", chars=len(flags_md))
+            return append_flags_summary(protocol_md, flags_md)
+
+    async def _draft(r):
+        async with _track_stage(job_id, "draft"):
+            size = await executor.run_io(_save_draft, builder, job_id)
+            _publish(job_id, "draft", draft_url=f"/jobs/{job_id}/result?draft=true", bytes=size)
+
+    async def _docx(r):
+        # Finish the DOCX — tables are embedded in the markdown, or were
+        # rendered from builder.pdf_tables at their placeholders
+        _, fed_md, _ = r["convert"]
+        async with _track_stage(job_id, "docx"):
+            return await executor.run_io(_finish_docx, builder, r["flag"], fed_md)
+
+    graph = StageGraph()
+    graph.add("extract", _extract)
+    graph.add("clean", _clean, deps=["extract"])
+    graph.add("convert", _convert, deps=["clean"])
+    graph.add("flag", _flag, deps=["clean", "convert"])
+    docx_deps = ["flag"]
+    if job_id:
+        # The draft reads the builder, so the docx stage waits for it
+        graph.add("draft", _draft, deps=["convert"])
+        docx_deps.append("draft")
+    graph.add("docx", _docx, deps=docx_deps)
+    try:
+        results = await graph.arun()
+    except StageError as e:
+        # Stage functions raise _StageFailed via _track_stage
+        raise e.error
+    return results["docx"]
+
+
+# Multipart overhead (boundaries, part headers) tolerated on top of MAX_FILE_SIZE
+# when rejecting by Content-Length, and the cap on non-file form fields
+_MULTIPART_SLACK = 64 * 1024
+# A PDF header must appear within the first 1024 bytes
+_PDF_MAGIC = b"%PDF-"
+_PDF_HEADER_WINDOW = 1024
+
+# Request body schema for the upload endpoints, which parse the body themselves
+_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+class _UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class _PdfUpload:
+    """python-multipart callbacks that collect the 'file' field, validating it
+    as it arrives (raising _UploadRejected); flush() writes it to pdf_path."""
+
+    def __init__(self, pdf_path: Path):
+        self.pdf_path = pdf_path
+        self.filename: str | None = None
+        self.size = 0
+        self._out = None
+        self._pending: list[bytes] = []
+        self._head = b""
+        self._checked = False
+        self._in_file = False
+        self._other_bytes = 0
+        self.complete = False
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+        self._field = self._value = b""
+
+    def _header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self) -> None:
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if params.get(b"name") != b"file" and b"filename" in params:
+            # A file sent under another field name: say so rather than count
+            # it against the form-field budget
+            raise _UploadRejected(422, "Missing 'file' field")
+        if params.get(b"name") != b"file" or self.filename is not None:
+            return
+        self.filename = params.get(b"filename", b"").decode("utf-8", "replace")
+        if not self.filename.lower().endswith(".pdf"):
+            raise _UploadRejected(400, "Only PDF files are allowed")
+        self._in_file = True
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_file:
+            self._other_bytes += end - start
+            if self._other_bytes > _MULTIPART_SLACK:
+                raise _UploadRejected(413, "Form fields too large")
+            return
+        self.size += end - start
+        if self.size > MAX_FILE_SIZE:
+            raise _UploadRejected(413, "File size exceeds 20MB limit")
+        chunk = bytes(data[start:end])
+        if not self._checked:
+            self._head += chunk
+            if len(self._head) >= _PDF_HEADER_WINDOW:
+                self._check_magic()
+        self._pending.append(chunk)
+
+    def _part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            if not self._checked:
+                self._check_magic()
+            self.complete = True
+
+    def _check_magic(self) -> None:
+        self._checked = True
+        if _PDF_MAGIC not in self._head[:_PDF_HEADER_WINDOW]:
+            raise _UploadRejected(400, "File is not a valid PDF")
+        self._head = b""
+
+    def _write(self, data: bytes) -> None:
+        if self._out is None:
+            self._out = open(self.pdf_path, "wb")
+        self._out.write(data)
+
+    async def flush(self) -> None:
+        """Write the file data parsed so far (called between body chunks).
+
+        The write runs on the I/O pool so slow storage doesn't stall the
+        event loop (and with it SSE heartbeats and /health).
+        """
+        if self._pending:
+            data = b"".join(self._pending)
+            self._pending.clear()
+            await executor.run_io(self._write, data)
+
+    async def close(self) -> None:
+        if self._out is not None:
+            await executor.run_io(self._out.close)
+
+
+async def _receive_pdf(request: Request, pdf_path: Path) -> tuple[str, int]:
+    """Stream the 'file' field of a multipart upload to pdf_path and return
+    (filename, size).
+
+    The body is parsed chunk by chunk as it arrives and written straight to
+    disk, so an upload never sits in memory whole.  Oversize uploads (413),
+    non-.pdf filenames and content without a PDF header (400) are rejected
+    as soon as the offending bytes arrive, or up front from Content-Length.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > MAX_FILE_SIZE + _MULTIPART_SLACK:
         raise HTTPException(status_code=413, detail="File size exceeds 20MB limit")
 
-    file_size_mb = len(file_content) / (1024 * 1024)
-    logger.info(f"[{datetime.now()}] Conversion started: {file.filename} ({file_size_mb:.2f} MB)")
+    upload = _PdfUpload(pdf_path)
+    parser = MultipartParser(params[b"boundary"], upload.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await upload.flush()
+        parser.finalize()
+        await upload.flush()
+    except _UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        await upload.close()
 
-    # Create temporary directory
-    temp_dir = Path(tempfile.mkdtemp())
-    
+    if upload.filename is None:
+        raise HTTPException(status_code=422, detail="Missing 'file' field")
+    if not upload.complete:
+        # The file part never ended (truncated body)
+        raise HTTPException(status_code=400, detail="Incomplete upload")
+    metrics.observe_upload(upload.size)
+    return upload.filename, upload.size
+
+
+def _make_temp_dir() -> Path:
+    return Path(tempfile.mkdtemp(prefix=f"{TEMP_DIR_PREFIX}{os.getpid()}-"))
+
+
+def _pid_alive(pid: int) -> bool:
     try:
-        # Save uploaded PDF
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _remove_orphan_temp_dirs() -> int:
+    """Remove scratch directories whose server process is gone (e.g. killed
+    mid-conversion).  Directories of other live workers are left alone; this
+    process has none yet at startup, so a reused pid counts as gone.
+    Returns how many were removed."""
+    removed = 0
+    for path in Path(tempfile.gettempdir()).glob(f"{TEMP_DIR_PREFIX}*-*"):
+        pid = path.name[len(TEMP_DIR_PREFIX):].split("-", 1)[0]
+        if not pid.isdigit() or not path.is_dir():
+            continue
+        if int(pid) != os.getpid() and _pid_alive(int(pid)):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def _load_client_and_contract() -> tuple[AsyncOpenAI, str]:
+    # Shared OpenAI client, created at startup
+    if llm_client is None:
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
+    client = llm_client
+
+    # Load contract
+    contract_path = Path(__file__).parent.parent.parent / "contract.md"
+    if not contract_path.exists():
+        raise HTTPException(status_code=500, detail="contract.md not found in repository root")
+
+    with open(contract_path, 'r', encoding='utf-8') as f:
+        contract = f.read()
+    return client, contract
+
+
+def _server_busy(endpoint: str, filename: str, e: ServerBusy) -> HTTPException:
+    logger.warning(f"[{datetime.now()}] Conversion rejected, server busy: {filename} - {e}")
+    metrics.observe_rejection(endpoint)
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": "30"},
+    )
+
+
+@app.post("/convert", openapi_extra=_UPLOAD_OPENAPI)
+async def convert_pdf(request: Request):
+    """
+    Convert uploaded PDF to protocol DOCX.
+    """
+    # Scratch directory for the uploaded PDF; the DOCX is built in memory
+    temp_dir = _make_temp_dir()
+    filename = None
+
+    try:
+        # Stream the uploaded PDF to disk
         pdf_path = temp_dir / "input.pdf"
-        with open(pdf_path, 'wb') as f:
-            f.write(file_content)
-        
-        # Initialize OpenAI client
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
-        
-        client = OpenAI(api_key=api_key)
-        
-        # Load contract
-        contract_path = Path(__file__).parent.parent.parent / "contract.md"
-        if not contract_path.exists():
-            raise HTTPException(status_code=500, detail="contract.md not found in repository root")
-        
-        with open(contract_path, 'r', encoding='utf-8') as f:
-            contract = f.read()
-        
-        # Run pipeline
-        try:
-            raw_text = extract_text_from_pdf(pdf_path, client)
-            cleaned_text = clean_text(raw_text)
-            protocol_md = convert_to_protocol_markdown(client, contract, cleaned_text)
-            protocol_md = finalize_protocol_md(protocol_md)
-            flags_md = generate_flags_md(client, cleaned_text, protocol_md)
-            final_md = append_flags_summary(protocol_md, flags_md)
-        except Exception as e:
-            logger.error(f"[{datetime.now()}] Pipeline failed: {file.filename} - {e}")
-            raise HTTPException(status_code=500, detail=f"Pipeline error: {str(e)}")
-
-        # Convert to DOCX — tables are now embedded directly in the markdown
-        docx_path = temp_dir / "output.docx"
+        filename, size = await _receive_pdf(request, pdf_path)
+        logger.info(f"[{datetime.now()}] Conversion started: {filename} ({size / (1024 * 1024):.2f} MB)")
+
+        client, contract = _load_client_and_contract()
 
+        # Run pipeline
         try:
-            markdown_to_docx(final_md, docx_path, [])
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"DOCX conversion failed: {str(e)}")
+            async with executor.admit():
+                with metrics.track_conversion("convert"):
+                    docx_bytes = await _run_pipeline(pdf_path, client, contract)
+        except ServerBusy as e:
+            raise _server_busy("convert", filename, e)
+        except _StageFailed as e:
+            if e.stage == "docx":
+                raise HTTPException(status_code=500, detail=f"DOCX conversion failed: {str(e.error)}")
+            logger.error(f"[{datetime.now()}] Pipeline failed: {filename} - {e.error}")
+            raise HTTPException(status_code=500, detail=f"Pipeline error: {str(e.error)}")
         
-        logger.info(f"[{datetime.now()}] Conversion completed: {file.filename}")
+        logger.info(f"[{datetime.now()}] Conversion completed: {filename}")
 
-        # Return file
-        return FileResponse(
-            path=str(docx_path),
-            filename="protocol.docx",
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        # Return file; the temp directory is removed once the response is sent
+        return _docx_response(
+            docx_bytes,
+            "protocol.docx",
+            background=BackgroundTask(shutil.rmtree, temp_dir, ignore_errors=True),
         )
     
     except HTTPException:
@@ -384,7 +922,162 @@ async def convert_pdf(file: UploadFile = File(...)):
         raise
     
     except Exception as e:
-        logger.error(f"[{datetime.now()}] Unexpected error: {file.filename} - {e}")
+        logger.error(f"[{datetime.now()}] Unexpected error: {filename} - {e}")
         # Clean up temp directory
         shutil.rmtree(temp_dir, ignore_errors=True)
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+# -------------------------
+# Asynchronous job API
+# -------------------------
+# Background tasks are referenced here so they are not garbage-collected mid-run
+_job_tasks: set = set()
+
+
+async def _run_job(job_id: str, temp_dir: Path, client: AsyncOpenAI, contract: str) -> None:
+    """Run the pipeline for a submitted job and store the DOCX on success.
+
+    The executor slot was acquired by submit_job and is released here.  Job
+    store calls (SQLite writes, for SQLiteJobStore) run in the executor's
+    thread pool, off the event loop.
+    """
+    job = await executor.run_io(job_store.get, job_id)
+    filename = job["filename"] if job else job_id
+    try:
+        await executor.run_io(job_store.start, job_id)
+        with metrics.track_conversion("jobs"):
+            docx_bytes = await _run_pipeline(temp_dir / "input.pdf", client, contract, job_id=job_id)
+        await executor.run_io(job_store.put_result, job_id, docx_bytes)
+        await executor.run_io(job_store.finish, job_id)
+        _publish(job_id, "done", result_url=f"/jobs/{job_id}/result")
+        stage_times = ", ".join(f"{e['stage']}={e['seconds']}s" for e in job_events.history(job_id) if e.get("state") == "finished")
+        logger.info(f"[{datetime.now()}] Job completed: {job_id} ({filename}) {stage_times}")
+    except _StageFailed as e:
+        logger.error(f"[{datetime.now()}] Job failed: {job_id} ({filename}) - {e}")
+        await executor.run_io(job_store.finish, job_id, error=f"{e.stage} failed: {e.error}")
+        _publish(job_id, "error", stage=e.stage, detail=str(e.error))
+    except Exception as e:
+        logger.error(f"[{datetime.now()}] Job failed: {job_id} ({filename}) - {e}")
+        await executor.run_io(job_store.finish, job_id, error=f"Unexpected error: {e}")
+        _publish(job_id, "error", detail=str(e))
+    finally:
+        executor.release()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@app.post("/jobs", status_code=202, openapi_extra=_UPLOAD_OPENAPI)
+async def submit_job(request: Request):
+    """
+    Queue a PDF for conversion and return its job id immediately.
+    """
+    temp_dir = _make_temp_dir()
+    try:
+        filename, size = await _receive_pdf(request, temp_dir / "input.pdf")
+        client, contract = _load_client_and_contract()
+        try:
+            executor.acquire()
+        except ServerBusy as e:
+            raise _server_busy("jobs", filename, e)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    try:
+        job = await executor.run_io(job_store.create, new_job(filename))
+        _publish(job["id"], "queued", filename=filename, bytes=size)
+    except Exception:
+        executor.release()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    task = asyncio.create_task(_run_job(job["id"], temp_dir, client, contract))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+    logger.info(f"[{datetime.now()}] Job queued: {job['id']} ({filename}, {size / (1024 * 1024):.2f} MB)")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events",
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Report a job's status, current stage and per-stage timing.
+    """
+    job = await executor.run_io(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "done":
+        job["result_url"] = f"/jobs/{job_id}/result"
+    return job
+
+
+def _final_event(job_id: str, job: dict) -> dict:
+    """The SSE payload for a finished job: its result URL, or the error."""
+    if job["status"] == "done":
+        return {"event": "done", "result_url": f"/jobs/{job_id}/result"}
+    return {"event": "error", "detail": job["error"]}
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream a job's progress as Server-Sent Events until it finishes.
+    """
+    job = await executor.run_io(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _sse():
+        if not job_events.history(job_id) and job["status"] in ("done", "error"):
+            # Finished before this process started (e.g. after a restart): no
+            # event history, so report the final state only.
+            payload = _final_event(job_id, job)
+            yield f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+            return
+        async for payload in job_events.subscribe(job_id):
+            if payload is None:
+                # Idle: make sure the job didn't finish without us seeing it
+                # (events are per-process; the store is shared)
+                current = await executor.run_io(job_store.get, job_id)
+                if current and current["status"] in ("done", "error"):
+                    payload = _final_event(job_id, current)
+                    yield f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        _sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, draft: bool = False):
+    """
+    Stream the finished DOCX for a completed job.  With ?draft=true, stream
+    the draft (without review flags), available as soon as conversion ends.
+    """
+    job = await executor.run_io(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if draft:
+        data = await executor.run_io(job_store.get_result, job_id, draft=True)
+        if data is None:
+            raise HTTPException(status_code=409, detail=f"No draft available yet (status: {job['status']})")
+    else:
+        if job["status"] != "done":
+            raise HTTPException(status_code=409, detail=f"Job is not finished (status: {job['status']})")
+        data = await executor.run_io(job_store.get_result, job_id)
+        if data is None:
+            raise HTTPException(status_code=410, detail="Job result is no longer available")
+
+    return _docx_response(data, "protocol_draft.docx" if draft else "protocol.docx")
@@ -0,0 +1,331 @@
+"""benchmark.py
+
+Time the extraction and rendering hot paths and track them across commits,
+the way quality_scorer.py tracks output quality.
+
+Each PDF in input_pdfs/ — plus synthetic scaled-up copies made by repeating
+its pages (pikepdf) — is run through:
+
+    extract_text_from_pdf, extract_tables_from_pdf, clean_text,
+    reinsert_tables_into_markdown, run_batch.md_to_docx, app.markdown_to_docx
+
+No API calls are made: the vision fallback gets a local stub client that
+answers instantly, and the protocol markdown fed to the rendering steps is
+synthesized from the cleaned text and table headings (deterministic, and it
+grows with the document).  The LLM and vision caches are disabled so every
+run measures the uncached path.
+
+Results (median and fastest of --repeat runs per step) go to a timestamped
+report and are appended to test_data/reports/bench_history.json; each
+document is compared against its most recent earlier measurement there.
+
+Usage:
+    python benchmark.py                          # all PDFs, scaled x4
+    python benchmark.py --pdf "Test PDF 7" --scale 4 16 --repeat 5
+    python benchmark.py --fail-on-regression     # exit 1 if a step got slower
+"""
+
+import os
+
+# Measure the uncached path, and keep app.py's job store off disk
+os.environ.setdefault("LLM_CACHE", "0")
+os.environ.setdefault("VISION_CACHE", "0")
+os.environ.setdefault("JOB_STORE", "memory")
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+SCRIPT_DIR = Path(__file__).parent
+REPO_ROOT  = (SCRIPT_DIR / "../..").resolve()
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(SCRIPT_DIR))
+
+import instrument
+import run_batch
+from app import markdown_to_docx
+from quality_scorer import get_git_commit
+
+# ---------------------------------------------------------------------------
+# Paths
+# ---------------------------------------------------------------------------
+PDF_DIR    = REPO_ROOT / "input_pdfs"
+REPORT_DIR = SCRIPT_DIR / "test_data" / "reports"
+
+BENCH_HISTORY_PATH = REPORT_DIR / "bench_history.json"
+VERSION = "1.0"
+
+STEPS = [
+    "extract_text_from_pdf",
+    "extract_tables_from_pdf",
+    "clean_text",
+    "reinsert_tables_into_markdown",
+    "md_to_docx",
+    "app.markdown_to_docx",
+]
+
+
+# ---------------------------------------------------------------------------
+# LLM stand-ins
+# ---------------------------------------------------------------------------
+
+_STUB_VISION_TABLE = "| Reagent | Volume |\n|---|---|\n| Buffer A | 10 mL |"
+
+
+class StubVisionClient:
+    """Answers vision fallback requests instantly with a fixed table."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    @staticmethod
+    def _create(model, messages, **kwargs):
+        message = SimpleNamespace(content=_STUB_VISION_TABLE)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def synthesize_protocol_md(cleaned: str, tables: list) -> str:
+    """Protocol-shaped markdown standing in for the model output: a section
+    per source table heading (so table reinsertion finds matches), with the
+    cleaned paragraphs as numbered steps and TABLE_PENDING markers."""
+    headings = list(dict.fromkeys(td.get("section_heading") or "" for td in tables))
+    headings = [h for h in headings if h] or ["Procedure"]
+    paragraphs = [p for p in cleaned.split("\n\n") if p.strip()]
+    per_section = max(1, -(-len(paragraphs) // len(headings)))
+
+    lines = ["# Protocol", "", "## Overview", "", "- Synthetic benchmark document", ""]
+    for i, para in enumerate(paragraphs):
+        step = i % per_section
+        if step == 0:
+            lines += [f"## {headings[min(i // per_section, len(headings) - 1)]}", ""]
+        lines.append(f"{step + 1}. **Step {step + 1}.** {para[:800]}")
+        if step == per_section - 1:
+            lines += ["", "TABLE_PENDING", ""]
+    lines += ["", "## Review Checklist", "", "- [ ] Verify volumes", ""]
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Documents
+# ---------------------------------------------------------------------------
+
+def scale_pdf(src: Path, factor: int, out_dir: Path) -> Path:
+    """Write a copy of src with its pages repeated `factor` times."""
+    import pikepdf
+
+    out_path = out_dir / f"{src.stem} x{factor}.pdf"
+    with pikepdf.open(src) as pdf:
+        originals = list(pdf.pages)
+        for _ in range(factor - 1):
+            pdf.pages.extend(originals)
+        pdf.save(out_path)
+    return out_path
+
+
+def page_count(pdf_path: Path) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+def _time(fn, repeat: int):
+    """Run fn `repeat` times; returns (last result, list of seconds)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, times
+
+
+def bench_document(pdf_path: Path, repeat: int, page_workers: int, work_dir: Path) -> dict:
+    """Time every step on one PDF; returns {step: {median, min, runs}} plus
+    document stats under '_doc'."""
+    client = StubVisionClient()
+    timings: dict[str, list] = {}
+
+    raw, timings["extract_text_from_pdf"] = _time(
+        lambda: run_batch.extract_text_from_pdf(pdf_path, client, workers=page_workers), repeat)
+    tables, timings["extract_tables_from_pdf"] = _time(
+        lambda: run_batch.extract_tables_from_pdf(pdf_path, client, workers=page_workers), repeat)
+    cleaned, timings["clean_text"] = _time(lambda: run_batch.clean_text(raw), repeat)
+
+    protocol_md = synthesize_protocol_md(cleaned, tables)
+    md, timings["reinsert_tables_into_markdown"] = _time(
+        lambda: run_batch.reinsert_tables_into_markdown(protocol_md, tables), repeat)
+    _, timings["md_to_docx"] = _time(
+        lambda: run_batch.md_to_docx(md, work_dir / "batch.docx", []), repeat)
+    _, timings["app.markdown_to_docx"] = _time(
+        lambda: markdown_to_docx(md, work_dir / "app.docx", []), repeat)
+
+    results = {
+        step: {
+            "median": round(statistics.median(times), 4),
+            "min": round(min(times), 4),
+            "runs": len(times),
+        }
+        for step, times in timings.items()
+    }
+    results["_doc"] = {
+        "pages": page_count(pdf_path),
+        "bytes": pdf_path.stat().st_size,
+        "raw_chars": len(raw),
+        "tables": len(tables),
+        "markdown_chars": len(md),
+    }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# History and report
+# ---------------------------------------------------------------------------
+
+def load_history() -> list:
+    if BENCH_HISTORY_PATH.exists():
+        try:
+            return json.loads(BENCH_HISTORY_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            return []
+    return []
+
+
+def previous_best(history: list, doc: str) -> tuple[str, dict] | tuple[None, None]:
+    """(commit, {step: min seconds}) of the most recent entry that timed doc.
+    Regressions are judged on the fastest run, which is the least noisy."""
+    for entry in reversed(history):
+        if doc in entry.get("results", {}):
+            return entry["commit"], {
+                step: r["min"] for step, r in entry["results"][doc].items() if step != "_doc"
+            }
+    return None, None
+
+
+def build_report(results: dict, history: list, timestamp: str, commit: str, threshold: float) -> tuple[str, list]:
+    """Returns (report text, list of regressions as (doc, step, old, new))."""
+    lines = [
+        "=" * 78,
+        f"  BENCHMARK  |  {timestamp}  |  commit {commit}  |  v{VERSION}",
+        f"  python {platform.python_version()}  |  {platform.machine()}  |  {os.cpu_count()} CPU(s)",
+        "=" * 78,
+        "",
+    ]
+    regressions = []
+    for doc, steps in results.items():
+        info = steps["_doc"]
+        prev_commit, prev = previous_best(history, doc)
+        lines.append(f"  {doc}  ({info['pages']} pages, {info['tables']} tables, {info['raw_chars']:,} chars)")
+        header = f"    {'step':32s} {'median':>9s} {'min':>9s}"
+        if prev:
+            header += f"   min vs {prev_commit}"
+        lines.append(header)
+        for step in STEPS:
+            r = steps[step]
+            row = f"    {step:32s} {r['median']:8.3f}s {r['min']:8.3f}s"
+            old = (prev or {}).get(step)
+            if old:
+                change = (r["min"] - old) / old
+                row += f"   {change:+7.1%}"
+                # Ignore noise on steps too fast to time reliably
+                if change > threshold and r["min"] - old > 0.005:
+                    row += "  !! slower"
+                    regressions.append((doc, step, old, r["min"]))
+            lines.append(row)
+        lines.append("")
+
+    lines += ["=" * 78, f"  REGRESSIONS  (> {threshold:.0%} slower than previous run)", "=" * 78]
+    if regressions:
+        for doc, step, old, new in regressions:
+            lines.append(f"  !! {doc} / {step}: {old:.3f}s -> {new:.3f}s")
+    else:
+        lines.append("  None.")
+    lines.append("")
+    return "\n".join(lines), regressions
+
+
+def append_bench_history(history: list, results: dict, timestamp: str, commit: str, repeat: int) -> None:
+    history.append({
+        "timestamp":   timestamp,
+        "commit":      commit,
+        "python":      platform.python_version(),
+        "repeat":      repeat,
+        "peak_rss_mb": instrument.peak_rss_mb(),
+        "results":     results,
+    })
+    BENCH_HISTORY_PATH.write_text(json.dumps(history, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark extraction and DOCX rendering.")
+    parser.add_argument("--pdf", metavar="STEM", action="append",
+                        help="PDF stem in input_pdfs/ to benchmark (repeatable; default: all).")
+    parser.add_argument("--scale", type=int, nargs="*", default=[4],
+                        help="Page repetition factors for synthetic documents (default: 4; none to skip).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per step (default: 3).")
+    parser.add_argument("--page-workers", type=int, default=1, help="Processes for page-parallel extraction.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown reported as a regression (default: 0.15).")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions.")
+    parser.add_argument("--no-history", action="store_true", help="Don't append to bench_history.json.")
+    args = parser.parse_args()
+
+    logging.getLogger("run_batch").setLevel(logging.WARNING)
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    commit    = get_git_commit()
+
+    pdfs = [PDF_DIR / f"{stem}.pdf" for stem in args.pdf] if args.pdf else sorted(PDF_DIR.glob("*.pdf"))
+    missing = [p for p in pdfs if not p.exists()]
+    if missing:
+        sys.exit(f"[ERROR] Not found: {', '.join(str(p) for p in missing)}")
+    if not pdfs:
+        sys.exit(f"[ERROR] No PDFs found in {PDF_DIR}")
+
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="protocol-bench-") as tmp:
+        work_dir = Path(tmp)
+        docs = [(p.stem, p) for p in pdfs]
+        for factor in [f for f in args.scale if f > 1]:
+            docs += [(f"{p.stem} x{factor}", scale_pdf(p, factor, work_dir)) for p in pdfs]
+
+        print(f"Benchmarking {len(docs)} document(s)  |  commit {commit}  |  repeat {args.repeat}\n")
+        for name, path in docs:
+            print(f"  {name} ...", end=" ", flush=True)
+            t0 = time.perf_counter()
+            results[name] = bench_document(path, args.repeat, args.page_workers, work_dir)
+            print(f"{time.perf_counter() - t0:.1f}s")
+
+    history = load_history()
+    report_text, regressions = build_report(results, history, timestamp, commit, args.threshold)
+    report_path = REPORT_DIR / f"{timestamp}_bench.txt"
+    report_path.write_text(report_text, encoding="utf-8")
+    print("\n" + report_text)
+    print(f"Report written to: {report_path}")
+
+    if not args.no_history:
+        append_bench_history(history, results, timestamp, commit, args.repeat)
+        print(f"Benchmark history updated: {BENCH_HISTORY_PATH}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""executor.py
+
+Bounded execution layer for the conversion pipeline.
+
+The pipeline functions in run_batch.py are blocking: pdfplumber extraction and
+python-docx rendering are CPU-bound.  (LLM calls use the async client and run
+on the event loop.)  PipelineExecutor keeps the blocking work off the loop:
+
+  - run_cpu()  dispatches to a process pool (pdfplumber / python-docx work)
+  - run_io()   dispatches to a thread pool (blocking I/O, e.g. saving DOCX
+               files and job results)
+  - admit()    caps the number of conversions in flight; callers beyond the
+               cap get ServerBusy so the endpoint can answer 503 instead of
+               letting requests pile up behind each other.  acquire() and
+               release() are the unscoped equivalents, for work that outlives
+               the request that admitted it (background jobs).
+
+Limits are read from the environment:
+    CONVERT_CPU_WORKERS   process pool size      (default: cpu count, max 4)
+    CONVERT_LLM_WORKERS   thread pool size       (default: 8)
+    CONVERT_MAX_PENDING   conversions in flight  (default: 16)
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+
+class ServerBusy(Exception):
+    """Raised by PipelineExecutor.admit() when the in-flight cap is reached."""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        value = int(os.getenv(name, ""))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+class PipelineExecutor:
+    def __init__(self, cpu_workers: int = None, llm_workers: int = None, max_pending: int = None):
+        self.cpu_workers = cpu_workers or _env_int("CONVERT_CPU_WORKERS", min(os.cpu_count() or 1, 4))
+        self.llm_workers = llm_workers or _env_int("CONVERT_LLM_WORKERS", 8)
+        self.max_pending = max_pending or _env_int("CONVERT_MAX_PENDING", 16)
+        self._cpu_pool = None
+        self._io_pool = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="llm")
+        logger.info(
+            "Executor started: cpu_workers=%d llm_workers=%d max_pending=%d",
+            self.cpu_workers, self.llm_workers, self.max_pending,
+        )
+
+    def shutdown(self) -> None:
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=True, cancel_futures=True)
+            self._cpu_pool = None
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True, cancel_futures=True)
+            self._io_pool = None
+
+    def acquire(self) -> None:
+        """Reserve a conversion slot, raising ServerBusy immediately (without
+        waiting) when max_pending conversions are already in flight."""
+        if self._pending >= self.max_pending:
+            raise ServerBusy(f"{self._pending} conversions already in flight")
+        self._pending += 1
+
+    def release(self) -> None:
+        self._pending = max(0, self._pending - 1)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserve a conversion slot for the duration of the block."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        """Run a picklable, module-level function in the process pool."""
+        if self._cpu_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._cpu_pool, partial(fn, *args, **kwargs))
+
+    async def run_io(self, fn, *args, **kwargs):
+        """Run a blocking I/O-bound function (e.g. a DOCX save) in the thread pool."""
+        if self._io_pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, partial(fn, *args, **kwargs))
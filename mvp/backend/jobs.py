@@ -0,0 +1,407 @@
+"""jobs.py
+
+Job records for asynchronous conversions (POST /jobs, GET /jobs/{id}).
+
+A job is a plain dict:
+
+    {
+      "id": "3f2c...",
+      "filename": "protocol.pdf",
+      "status": "queued" | "running" | "done" | "error",
+      "stage": "extract" | "clean" | "convert" | "flag" | "draft" | "docx" | None,
+      "created_at": "...", "started_at": "...", "finished_at": "...",
+      "elapsed_seconds": 50.45,
+      "stages": {"extract": {"started_at": ..., "ended_at": ..., "seconds": ...}, ...},
+      "error": None,
+    }
+
+The finished DOCX is stored alongside the record, as is a draft (the DOCX
+before review flags are appended) once conversion ends.  Two stores are provided:
+InMemoryJobStore (lost on restart) and SQLiteJobStore (survives restarts).
+make_job_store() picks one from the environment:
+
+    JOB_STORE         "sqlite" (default) or "memory"
+    JOB_DB_PATH       SQLite file (default: mvp/backend/jobs.sqlite3)
+    JOB_TTL_SECONDS   finished jobs are deleted, with their DOCX, this long
+                      after they finish (default: 86400; 0 keeps them)
+    JOB_MAX_FINISHED  at most this many finished jobs are kept, oldest
+                      deleted first (default: 500; 0 for no limit)
+
+Expired jobs are pruned whenever a job is created (and at startup), so
+neither memory nor jobs.sqlite3 grows without bound.
+
+JobEvents is the in-process progress feed behind GET /jobs/{id}/events: the
+pipeline publishes events as it runs and each subscriber gets the events so
+far followed by live ones until the job reaches a terminal event.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_DB_PATH = SCRIPT_DIR / "jobs.sqlite3"
+
+STAGES = ("extract", "clean", "convert", "flag", "draft", "docx")
+TERMINAL_EVENTS = ("done", "error")
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_FINISHED = 500
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def new_job(filename: str) -> dict:
+    now = _now()
+    return {
+        "id": uuid.uuid4().hex,
+        "filename": filename,
+        "status": "queued",
+        "stage": None,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "elapsed_seconds": None,
+        "stages": {},
+        "error": None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Store interface
+# ---------------------------------------------------------------------------
+
+class JobStore(ABC):
+    """Base class: subclasses implement _load/_save and the result methods.
+
+    The stage/finish helpers are shared and only go through _load/_save, so
+    each backend stays a thin persistence layer.  Finished jobs are kept for
+    ttl_seconds and at most max_finished of them (see prune; 0 or None
+    disables either limit).
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_finished: int = None):
+        self._lock = threading.Lock()
+        self._monotonic: dict[str, dict[str, float]] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max_finished
+
+    # -- persistence (backend-specific) ---------------------------------
+    @abstractmethod
+    def _load(self, job_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def _save(self, job: dict) -> None:
+        ...
+
+    @abstractmethod
+    def put_result(self, job_id: str, data: bytes, draft: bool = False) -> None:
+        ...
+
+    @abstractmethod
+    def get_result(self, job_id: str, draft: bool = False) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def unfinished_ids(self) -> list[str]:
+        ...
+
+    @abstractmethod
+    def _finished(self) -> list[tuple[str, str]]:
+        """(id, finished_at) of every finished job, oldest first."""
+
+    @abstractmethod
+    def _delete(self, job_ids: list[str]) -> None:
+        """Delete jobs and their results."""
+
+    # -- shared helpers -------------------------------------------------
+    def create(self, job: dict) -> dict:
+        with self._lock:
+            self._save(job)
+        self.prune()
+        return job
+
+    def prune(self) -> int:
+        """Delete finished jobs past the TTL and the oldest ones beyond
+        max_finished, with their results.  Returns the count."""
+        with self._lock:
+            finished = self._finished()
+            expired = set()
+            if self.ttl_seconds:
+                cutoff = (datetime.now() - timedelta(seconds=self.ttl_seconds)).isoformat(timespec="milliseconds")
+                expired.update(job_id for job_id, finished_at in finished if finished_at < cutoff)
+            if self.max_finished and len(finished) > self.max_finished:
+                expired.update(job_id for job_id, _ in finished[:len(finished) - self.max_finished])
+            if expired:
+                self._delete(sorted(expired))
+                for job_id in expired:
+                    self._monotonic.pop(job_id, None)
+        return len(expired)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            return self._load(job_id)
+
+    def update(self, job_id: str, **fields) -> dict | None:
+        with self._lock:
+            job = self._load(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job["updated_at"] = _now()
+            self._save(job)
+            return job
+
+    def start_stage(self, job_id: str, stage: str) -> None:
+        self._monotonic.setdefault(job_id, {})[stage] = time.monotonic()
+        with self._lock:
+            job = self._load(job_id)
+            if job is None:
+                return
+            job["stage"] = stage
+            job["stages"][stage] = {"started_at": _now(), "ended_at": None, "seconds": None}
+            job["updated_at"] = _now()
+            self._save(job)
+
+    def end_stage(self, job_id: str, stage: str) -> None:
+        t0 = self._monotonic.get(job_id, {}).pop(stage, None)
+        with self._lock:
+            job = self._load(job_id)
+            if job is None:
+                return
+            entry = job["stages"].setdefault(stage, {"started_at": None})
+            entry["ended_at"] = _now()
+            entry["seconds"] = round(time.monotonic() - t0, 2) if t0 is not None else None
+            job["updated_at"] = _now()
+            self._save(job)
+
+    def start(self, job_id: str) -> None:
+        self._monotonic.setdefault(job_id, {})["__job__"] = time.monotonic()
+        self.update(job_id, status="running", started_at=_now())
+
+    def finish(self, job_id: str, error: str = None) -> None:
+        t0 = self._monotonic.pop(job_id, {}).get("__job__")
+        self.update(
+            job_id,
+            status="error" if error else "done",
+            stage=None,
+            error=error,
+            finished_at=_now(),
+            elapsed_seconds=round(time.monotonic() - t0, 2) if t0 is not None else None,
+        )
+
+    def mark_interrupted(self) -> int:
+        """Fail jobs left queued/running by a previous process.  Returns the count."""
+        ids = self.unfinished_ids()
+        for job_id in ids:
+            self.update(job_id, status="error", stage=None, error="Interrupted by server restart", finished_at=_now())
+        return len(ids)
+
+
+# ---------------------------------------------------------------------------
+# In-memory backend
+# ---------------------------------------------------------------------------
+
+class InMemoryJobStore(JobStore):
+    def __init__(self, ttl_seconds: float = None, max_finished: int = None):
+        super().__init__(ttl_seconds, max_finished)
+        self._jobs: dict[str, str] = {}
+        self._results: dict[str, bytes] = {}
+        self._drafts: dict[str, bytes] = {}
+
+    def _load(self, job_id):
+        raw = self._jobs.get(job_id)
+        return json.loads(raw) if raw is not None else None
+
+    def _save(self, job):
+        # Stored serialized so callers never share a mutable dict with the store
+        self._jobs[job["id"]] = json.dumps(job)
+
+    def put_result(self, job_id, data, draft=False):
+        with self._lock:
+            (self._drafts if draft else self._results)[job_id] = data
+
+    def get_result(self, job_id, draft=False):
+        with self._lock:
+            return (self._drafts if draft else self._results).get(job_id)
+
+    def unfinished_ids(self):
+        with self._lock:
+            return [
+                job_id for job_id, raw in self._jobs.items()
+                if json.loads(raw)["status"] in ("queued", "running")
+            ]
+
+    def _finished(self):
+        jobs = (json.loads(raw) for raw in self._jobs.values())
+        finished = [(job["id"], job["finished_at"]) for job in jobs if job["status"] in ("done", "error")]
+        return sorted(finished, key=lambda item: item[1] or "")
+
+    def _delete(self, job_ids):
+        for job_id in job_ids:
+            self._jobs.pop(job_id, None)
+            self._results.pop(job_id, None)
+            self._drafts.pop(job_id, None)
+
+
+# ---------------------------------------------------------------------------
+# SQLite backend
+# ---------------------------------------------------------------------------
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, db_path: Path, ttl_seconds: float = None, max_finished: int = None):
+        super().__init__(ttl_seconds, max_finished)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " result BLOB)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "draft" not in columns:
+                # Databases created before drafts were stored
+                conn.execute("ALTER TABLE jobs ADD COLUMN draft BLOB")
+            if "finished_at" not in columns:
+                # Databases created before retention; backfilled from the records
+                conn.execute("ALTER TABLE jobs ADD COLUMN finished_at TEXT")
+                for job_id, data in conn.execute("SELECT id, data FROM jobs").fetchall():
+                    conn.execute(
+                        "UPDATE jobs SET finished_at = ? WHERE id = ?", (json.loads(data).get("finished_at"), job_id),
+                    )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (status, finished_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation keeps the store usable from
+        # both the event loop and executor threads.
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _load(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, job):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, finished_at, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = excluded.status, finished_at = excluded.finished_at, "
+                "data = excluded.data",
+                (job["id"], job["status"], job.get("finished_at"), json.dumps(job)),
+            )
+
+    def put_result(self, job_id, data, draft=False):
+        column = "draft" if draft else "result"
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (sqlite3.Binary(data), job_id))
+
+    def get_result(self, job_id, draft=False):
+        column = "draft" if draft else "result"
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f"SELECT {column} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bytes(row[0]) if row and row[0] is not None else None
+
+    def unfinished_ids(self):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [r[0] for r in rows]
+
+    def _finished(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, COALESCE(finished_at, '') FROM jobs WHERE status IN ('done', 'error') ORDER BY 2"
+            ).fetchall()
+        return [tuple(r) for r in rows]
+
+    def _delete(self, job_ids):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+
+def make_job_store() -> JobStore:
+    kind = os.getenv("JOB_STORE", "sqlite").strip().lower()
+    ttl_seconds = float(os.getenv("JOB_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+    max_finished = int(os.getenv("JOB_MAX_FINISHED", str(DEFAULT_MAX_FINISHED)))
+    if kind == "memory":
+        return InMemoryJobStore(ttl_seconds, max_finished)
+    if kind == "sqlite":
+        return SQLiteJobStore(Path(os.getenv("JOB_DB_PATH", str(DEFAULT_DB_PATH))), ttl_seconds, max_finished)
+    raise ValueError(f"Unknown JOB_STORE '{kind}' (expected 'sqlite' or 'memory')")
+
+
+# ---------------------------------------------------------------------------
+# Progress events
+# ---------------------------------------------------------------------------
+
+class JobEvents:
+    """Per-job progress event feed (event-loop only, not thread-safe).
+
+    Each event is a dict with at least "event" (its type) and "t" (seconds
+    since the job's first event).  History is kept for the most recent
+    max_jobs jobs so late subscribers can catch up.
+    """
+
+    def __init__(self, max_jobs: int = 500):
+        self.max_jobs = max_jobs
+        self._history: OrderedDict[str, list] = OrderedDict()
+        self._t0: dict[str, float] = {}
+        self._subscribers: dict[str, set] = {}
+
+    def publish(self, job_id: str, event: str, **data) -> dict:
+        history = self._history.get(job_id)
+        if history is None:
+            history = self._history[job_id] = []
+            self._t0[job_id] = time.monotonic()
+            while len(self._history) > self.max_jobs:
+                old_id, _ = self._history.popitem(last=False)
+                self._t0.pop(old_id, None)
+        payload = {"event": event, "t": round(time.monotonic() - self._t0[job_id], 3), **data}
+        history.append(payload)
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(payload)
+        return payload
+
+    def history(self, job_id: str) -> list:
+        return list(self._history.get(job_id, ()))
+
+    async def subscribe(self, job_id: str, heartbeat: float = 15.0):
+        """Yield past then live events for job_id, ending after a terminal
+        event.  Yields None every `heartbeat` seconds without an event so the
+        caller can keep idle connections alive."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            for payload in self.history(job_id):
+                yield payload
+                if payload["event"] in TERMINAL_EVENTS:
+                    return
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield payload
+                if payload["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
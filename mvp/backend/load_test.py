@@ -0,0 +1,395 @@
+"""load_test.py
+
+Fire PDFs at the conversion API at a target rate and report how the server
+copes: latency percentiles, error rates, and memory growth.
+
+Requests arrive open-loop at --rps (evenly spaced, or Poisson with
+--poisson) for --duration seconds, regardless of how fast the server
+answers, so overload shows up as latency and errors rather than as a
+silently lower request rate.  --mix chooses between the endpoints:
+
+    convert   POST /convert and wait for the DOCX
+    jobs      POST /jobs, poll GET /jobs/{id} until finished, GET the result
+
+Server memory (process_resident_memory_bytes) and in-flight conversions are
+sampled from GET /metrics throughout the run.
+
+By default the tool starts its own server — one uvicorn worker as in the
+Procfile, with the offline LLM backend (llm_backend.py) and an in-memory
+job store — so it runs anywhere without an API key.  Use --url to test a
+server that is already running instead.
+
+Results go to test_data/reports/<timestamp>_load.txt (and .json; the local
+server's log to <timestamp>_server.log).
+
+Usage:
+    python load_test.py --rps 2 --duration 60
+    python load_test.py --rps 5 --mix convert=3,jobs=1 --llm-latency lognormal:20,0.4
+    python load_test.py --url http://localhost:8000 --rps 1 --pdf "input_pdfs/Test PDF 7.pdf"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from quality_scorer import get_git_commit
+
+# ---------------------------------------------------------------------------
+# Paths
+# ---------------------------------------------------------------------------
+SCRIPT_DIR = Path(__file__).parent
+REPO_ROOT  = (SCRIPT_DIR / "../..").resolve()
+PDF_DIR    = REPO_ROOT / "input_pdfs"
+REPORT_DIR = SCRIPT_DIR / "test_data" / "reports"
+
+ENDPOINTS = ("convert", "jobs")
+PERCENTILES = (50, 90, 95, 99)
+
+
+# ---------------------------------------------------------------------------
+# Local server
+# ---------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(backend: str, llm_latency: str, env_overrides: dict, log_path: Path) -> tuple[subprocess.Popen, str]:
+    """Start `uvicorn app:app` (one worker, as in the Procfile) with an
+    offline LLM backend, logging to log_path; returns (process, base URL)
+    once /health answers."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "LLM_BACKEND": backend,
+        "LLM_FAKE_LATENCY": llm_latency,
+        "JOB_STORE": "memory",
+        "LLM_CACHE": "0",
+        **env_overrides,
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(SCRIPT_DIR),
+        env=env,
+        stdout=log_path.open("w", encoding="utf-8"),
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"[ERROR] Server exited during startup (code {proc.returncode}), see {log_path}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit("[ERROR] Server did not become healthy within 60s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ---------------------------------------------------------------------------
+# Requests
+# ---------------------------------------------------------------------------
+
+def _outcome(response: httpx.Response) -> str:
+    return "ok" if response.status_code < 400 else f"http_{response.status_code}"
+
+
+async def run_convert(client: httpx.AsyncClient, pdf: Path, data: bytes) -> str:
+    response = await client.post("/convert", files={"file": (pdf.name, data, "application/pdf")})
+    return _outcome(response)
+
+
+async def run_job(client: httpx.AsyncClient, pdf: Path, data: bytes, poll_interval: float) -> str:
+    response = await client.post("/jobs", files={"file": (pdf.name, data, "application/pdf")})
+    if response.status_code >= 400:
+        return _outcome(response)
+    status_url = response.json()["status_url"]
+    while True:
+        await asyncio.sleep(poll_interval)
+        response = await client.get(status_url)
+        if response.status_code >= 400:
+            return _outcome(response)
+        job = response.json()
+        if job["status"] == "error":
+            return "job_error"
+        if job["status"] == "done":
+            return _outcome(await client.get(job["result_url"]))
+
+
+async def one_request(client, endpoint: str, pdf: Path, data: bytes, poll_interval: float, results: list) -> None:
+    t0 = time.monotonic()
+    try:
+        if endpoint == "convert":
+            outcome = await run_convert(client, pdf, data)
+        else:
+            outcome = await run_job(client, pdf, data, poll_interval)
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    results.append({
+        "endpoint": endpoint,
+        "pdf": pdf.name,
+        "bytes": len(data),
+        "outcome": outcome,
+        "seconds": round(time.monotonic() - t0, 3),
+    })
+
+
+# ---------------------------------------------------------------------------
+# Server metrics
+# ---------------------------------------------------------------------------
+
+def _parse_metric(text: str, name: str) -> float | None:
+    for line in text.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            try:
+                return float(line.rsplit(" ", 1)[1])
+            except ValueError:
+                return None
+    return None
+
+
+async def sample_metrics(client: httpx.AsyncClient, interval: float, samples: list, stop: asyncio.Event) -> None:
+    """Record server RSS and in-flight conversions every `interval` seconds."""
+    t0 = time.monotonic()
+    while True:
+        try:
+            text = (await client.get("/metrics", timeout=5)).text
+            rss = _parse_metric(text, "process_resident_memory_bytes")
+            samples.append({
+                "t": round(time.monotonic() - t0, 1),
+                "rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+                "in_flight": _parse_metric(text, "protocol_conversions_in_flight"),
+            })
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"[ERROR] Unknown endpoint '{name}' in --mix (expected: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def generate_load(url: str, pdfs: list[Path], args) -> tuple[list, list, float]:
+    """Run the load; returns (request results, metric samples, seconds)."""
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    payloads = {pdf: pdf.read_bytes() for pdf in pdfs}
+    results: list[dict] = []
+    samples: list[dict] = []
+    stop = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=url, timeout=10) as metrics_client:
+        sampler = asyncio.create_task(sample_metrics(metrics_client, args.sample_interval, samples, stop))
+        tasks = []
+        t0 = time.monotonic()
+        next_at = 0.0
+        while next_at < args.duration:
+            delay = t0 + next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = rng.choices(list(mix), weights=list(mix.values()))[0]
+            pdf = rng.choice(pdfs)
+            tasks.append(asyncio.create_task(
+                one_request(client, endpoint, pdf, payloads[pdf], args.poll_interval, results)))
+            next_at += rng.expovariate(args.rps) if args.poisson else 1 / args.rps
+        print(f"  Sent {len(tasks)} request(s); waiting for responses ...", flush=True)
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - t0
+        stop.set()
+        await sampler
+    return results, samples, elapsed
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _percentile(values: list[float], p: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def summarize(results: list, samples: list, elapsed: float) -> dict:
+    summary = {"elapsed_seconds": round(elapsed, 1), "requests": len(results), "endpoints": {}}
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        rows = [r for r in results if r["endpoint"] == endpoint]
+        ok = sorted(r["seconds"] for r in rows if r["outcome"] == "ok")
+        outcomes: dict[str, int] = {}
+        for r in rows:
+            outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+        summary["endpoints"][endpoint] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(rows), 4),
+            "outcomes": outcomes,
+            "throughput_per_min": round(len(ok) / elapsed * 60, 2),
+            "latency": {},
+        }
+        if ok:
+            latency = {f"p{p}": round(_percentile(ok, p), 3) for p in PERCENTILES}
+            latency.update(max=ok[-1], mean=round(statistics.mean(ok), 3))
+            summary["endpoints"][endpoint]["latency"] = latency
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    if rss:
+        summary["memory"] = {
+            "start_mb": rss[0],
+            "peak_mb": max(rss),
+            "end_mb": rss[-1],
+            "growth_mb": round(rss[-1] - rss[0], 1),
+        }
+    in_flight = [s["in_flight"] for s in samples if s["in_flight"] is not None]
+    if in_flight:
+        summary["peak_in_flight"] = max(in_flight)
+    return summary
+
+
+def build_report(summary: dict, args, url: str, timestamp: str, commit: str) -> str:
+    lines = [
+        "=" * 70,
+        f"  LOAD TEST  |  {timestamp}  |  commit {commit}",
+        f"  {url}  |  {args.rps} req/s {'(Poisson) ' if args.poisson else ''}for {args.duration}s  |  mix {args.mix}",
+        "=" * 70,
+        "",
+        f"  {summary['requests']} request(s) completed in {summary['elapsed_seconds']}s",
+        "",
+    ]
+    for endpoint, s in summary["endpoints"].items():
+        lines.append(f"  /{endpoint}: {s['ok']}/{s['requests']} ok  "
+                     f"(error rate {s['error_rate']:.1%}, {s['throughput_per_min']} ok/min)")
+        if s["latency"]:
+            lat = s["latency"]
+            lines.append("    latency  " + "  ".join(f"p{p} {lat[f'p{p}']:.2f}s" for p in PERCENTILES)
+                         + f"  max {lat['max']:.2f}s")
+        errors = {k: v for k, v in s["outcomes"].items() if k != "ok"}
+        if errors:
+            lines.append("    errors   " + ", ".join(f"{k} x{v}" for k, v in sorted(errors.items())))
+        lines.append("")
+    if "memory" in summary:
+        m = summary["memory"]
+        lines.append(f"  Server RSS: start {m['start_mb']} MB, peak {m['peak_mb']} MB, "
+                     f"end {m['end_mb']} MB (growth {m['growth_mb']:+} MB)")
+    else:
+        lines.append("  Server RSS: not available (no /metrics)")
+    if "peak_in_flight" in summary:
+        lines.append(f"  Peak conversions in flight: {summary['peak_in_flight']:.0f}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the conversion API.")
+    parser.add_argument("--url", help="Server to test (default: start a local one with an offline LLM).")
+    parser.add_argument("--rps", type=float, default=1.0, help="Target request rate (default: 1).")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to send requests for (default: 30).")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of evenly spaced.")
+    parser.add_argument("--mix", default="convert=1", help="Endpoint weights, e.g. convert=3,jobs=1 (default: convert=1).")
+    parser.add_argument("--pdf", type=Path, action="append", help="PDF to upload (repeatable; default: input_pdfs/*.pdf).")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds (default: 600).")
+    parser.add_argument("--max-connections", type=int, default=200, help="Client connection limit (default: 200).")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Job status poll interval (default: 1s).")
+    parser.add_argument("--sample-interval", type=float, default=2.0, help="/metrics sampling interval (default: 2s).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request mix and arrivals.")
+    parser.add_argument("--backend", choices=("replay", "fake"), default="replay",
+                        help="LLM backend of the local server (default: replay).")
+    parser.add_argument("--llm-latency", default="lognormal:2,0.5",
+                        help="LLM_FAKE_LATENCY of the local server (default: lognormal:2,0.5).")
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the local server, e.g. CONVERT_MAX_PENDING=4.")
+    args = parser.parse_args()
+
+    if args.rps <= 0 or args.duration <= 0:
+        raise SystemExit("[ERROR] --rps and --duration must be positive")
+    pdfs = args.pdf or sorted(PDF_DIR.glob("*.pdf"))
+    if not pdfs:
+        raise SystemExit(f"[ERROR] No PDFs found in {PDF_DIR}")
+    missing = [str(p) for p in pdfs if not p.exists()]
+    if missing:
+        raise SystemExit(f"[ERROR] Not found: {', '.join(missing)}")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    commit    = get_git_commit()
+
+    proc = None
+    url = args.url
+    if url is None:
+        env_overrides = dict(item.split("=", 1) for item in args.server_env)
+        log_path = REPORT_DIR / f"{timestamp}_server.log"
+        proc, url = start_server(args.backend, args.llm_latency, env_overrides, log_path)
+        print(f"Started local server at {url} (LLM backend: {args.backend}, latency {args.llm_latency}, log: {log_path})")
+    try:
+        print(f"Load test: {args.rps} req/s for {args.duration}s, mix {args.mix}, {len(pdfs)} PDF(s)")
+        results, samples, elapsed = asyncio.run(generate_load(url, pdfs, args))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    summary = summarize(results, samples, elapsed)
+    report_text = build_report(summary, args, url, timestamp, commit)
+    print("\n" + report_text)
+
+    report_path = REPORT_DIR / f"{timestamp}_load.txt"
+    report_path.write_text(report_text, encoding="utf-8")
+    (REPORT_DIR / f"{timestamp}_load.json").write_text(json.dumps({
+        "timestamp": timestamp,
+        "commit":    commit,
+        "url":       url,
+        "config":    {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k != "pdf"},
+        "pdfs":      [p.name for p in pdfs],
+        "summary":   summary,
+        "memory":    samples,
+        "requests":  results,
+    }, indent=2), encoding="utf-8")
+    print(f"Report written to: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""metrics.py
+
+Prometheus metrics for the backend, served by GET /metrics.
+
+Request-level metrics are updated by app.py (track_conversion(),
+observe_upload(), observe_rejection()).  Everything below the request
+level comes from the pipeline's instrumentation spans (instrument.py): the
+listener registered here turns finished spans into metrics, so stages, LLM
+calls and retries are counted wherever they run in this process.  (The
+backend extracts without a vision client, so there are no vision-fallback
+series; run_batch.py's run logs cover those.)
+
+    protocol_conversion_seconds{endpoint,status}   end-to-end latency
+    protocol_conversions_in_flight                 conversions running now
+    protocol_rejected_total{endpoint}              503s from the in-flight cap
+    protocol_upload_bytes                          uploaded PDF sizes
+    protocol_stage_seconds{stage}                  per-stage latency
+    protocol_llm_call_seconds{kind,model}          LLM call latency
+    protocol_llm_tokens_total{kind,direction}      LLM tokens in / out / cached
+                                                   (cached: input tokens served
+                                                   from the provider's prompt cache)
+    protocol_llm_cache_total{result}               LLM cache hits / misses
+    protocol_llm_retries_total{exception}          retried LLM errors
+
+The process collector's process_resident_memory_bytes etc. are included.
+When several server processes share a port, set PROMETHEUS_MULTIPROC_DIR
+(see prometheus_client's multiprocess mode) and /metrics aggregates them.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+
+import instrument
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+_LATENCY_BUCKETS = (1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600, 1200)
+_STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+_UPLOAD_BUCKETS = tuple(kb * 1024 for kb in (16, 64, 256, 512, 1024, 2048, 5120, 10240, 20480))
+
+CONVERSION_SECONDS = Histogram(
+    "protocol_conversion_seconds", "End-to-end conversion latency.",
+    ["endpoint", "status"], buckets=_LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "protocol_conversions_in_flight", "Conversions currently running.",
+    multiprocess_mode="livesum",
+)
+REJECTED = Counter("protocol_rejected_total", "Conversions rejected because the server was busy.", ["endpoint"])
+UPLOAD_BYTES = Histogram("protocol_upload_bytes", "Size of uploaded PDFs.", buckets=_UPLOAD_BUCKETS)
+STAGE_SECONDS = Histogram("protocol_stage_seconds", "Pipeline stage latency.", ["stage"], buckets=_STAGE_BUCKETS)
+LLM_CALL_SECONDS = Histogram(
+    "protocol_llm_call_seconds", "LLM call latency (cache hits excluded).",
+    ["kind", "model"], buckets=_STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter("protocol_llm_tokens_total", "LLM tokens used.", ["kind", "direction"])
+LLM_CACHE = Counter("protocol_llm_cache_total", "LLM cache lookups.", ["result"])
+LLM_RETRIES = Counter("protocol_llm_retries_total", "LLM calls retried after a transient error.", ["exception"])
+
+
+@contextmanager
+def track_conversion(endpoint: str):
+    """Count a conversion as in flight and observe its latency and outcome."""
+    IN_FLIGHT.inc()
+    t0 = time.monotonic()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        IN_FLIGHT.dec()
+        CONVERSION_SECONDS.labels(endpoint, status).observe(time.monotonic() - t0)
+
+
+def observe_upload(size: int) -> None:
+    UPLOAD_BYTES.observe(size)
+
+
+def observe_rejection(endpoint: str) -> None:
+    REJECTED.labels(endpoint).inc()
+
+
+def _on_span(span: dict) -> None:
+    """instrument listener: update metrics from a finished span."""
+    name = span["name"]
+    if name.startswith("stage."):
+        STAGE_SECONDS.labels(name[len("stage."):]).observe(span["seconds"])
+    elif name == "llm":
+        kind = span.get("kind") or "unknown"
+        if span.get("cached") is not None:
+            LLM_CACHE.labels("hit" if span["cached"] else "miss").inc()
+        if span.get("cached"):
+            return
+        LLM_CALL_SECONDS.labels(kind, span.get("model") or "unknown").observe(span["seconds"])
+        for direction in ("input", "output", "cached"):
+            tokens = span.get(f"{direction}_tokens")
+            if tokens:
+                LLM_TOKENS.labels(kind, direction).inc(tokens)
+    elif name == "retry_wait":
+        LLM_RETRIES.labels(span.get("error") or "unknown").inc()
+
+
+instrument.add_listener(_on_span)
+
+
+def render() -> bytes:
+    """The current metrics in the Prometheus text format."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
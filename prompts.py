@@ -0,0 +1,174 @@
+"""prompts.py
+
+Prompt templates for the LLM calls in run_batch.py.
+
+Every prompt is laid out as a static prefix followed by the per-call text:
+
+    convert   rules, contract          | part note, input text
+              (two rule sets: table values inlined, or table placeholders kept)
+    flag      reviewer instructions    | source text, generated protocol
+    vision    extraction instructions  | page image
+
+The API caches prompt prefixes: OpenAI reuses the longest previously seen
+prefix of 1024+ tokens, in 128-token steps, for a few minutes, billing it at a
+discount and skipping its prefill.  Anything that varies between calls
+therefore comes after everything that does not, and the static text is built
+once (at import; the conversion prefix once per contract) so every call
+sends it byte for byte.  Only the conversion prefix is currently long enough
+to be cached; the others are ordered the same way so they qualify if they
+grow.  Cached token counts are reported per call in run_log.json and in the
+batch summary.
+
+Each template's VERSION is a hash of its text and layout, so results in the
+LLM cache (llm_cache.py) are invalidated whenever a prompt changes.
+"""
+
+import hashlib
+from functools import lru_cache
+
+_CONVERT_COMMON_RULES = """
+You are a careful scientific editor.
+
+Follow the protocol output contract STRICTLY.
+Do not add or invent scientific content.
+Preserve all numbers/units/times/temperatures exactly.
+If something is unclear, write "[CHECK]" rather than guessing.
+
+STEP COMPLETENESS: Every numbered step must begin with a verb or subject and be a fully self-contained sentence. If the source text for a step begins mid-sentence, reconstruct the full sentence before outputting it. Never output a step that begins with a lowercase letter, a conjunction (such as and, or, but, so, then, while), or a word that implies a preceding clause.
+
+SECTION HEADINGS: Output every section heading from the source document as its own standalone markdown heading using the exact wording from the source. This includes passage labels such as "Passage 1", "Passage 2", "Passage 3-5" and any other named or numbered subsections — each must appear as a separate heading and must not be merged with adjacent section titles or wrapped in parentheses as part of another heading. Do not reorder or rename any section. Do not add any section headings that do not exist in the source document, including headings such as "Objective", "Procedure", or "Materials" unless those exact words appear as headings in the source.
+
+SOURCE FIDELITY: Do not add any sections, content, checklists, flags, or commentary that does not exist in the source document. The output must contain only what is present in the source. Do not add review checklists, parameter summaries, missing-parameter analysis, unsupported-claims sections, or any other AI-generated content.
+
+REAGENT DEFINITIONS: When a protocol step references a named reagent mixture (e.g. "recommended growth medium", "complete medium", or any reagent given a proper name), include the full composition of that mixture either inline in that step as a sub-bullet or in a Materials section at the top of the document. Do not reference a named mixture without defining it somewhere in the document.
+
+NUMBERED STEPS: Output every procedural step as a markdown numbered list item using the format "1. text", "2. text", and so on. Every procedural step in the source must appear as a numbered list item in the output. Do not let any step fall through to plain text.
+
+LIST NUMBERING: Whenever a new section or subsection heading appears, any numbered list that follows must restart at 1. Each procedural section is independent and must have its own numbering starting from 1.
+""".strip()
+
+# How tables are handled: values inlined into the steps (default), or left
+# as TABLE_PLACEHOLDER_N lines for tables rendered from the PDF's rows
+_CONVERT_TABLE_RULES = """
+TABLES: Do not reproduce any tables in the output. Instead, read the data from each table in the source and embed the relevant values directly into the protocol step they belong to. For example, if a table lists wash volumes by system type, incorporate those volumes into the wash step as inline text: 'Wash with DPBS (2-layer: 80 mL, 3-layer: 120 mL, 10-layer: 400 mL, 13-layer: 520 mL per system)'. Every value from every table must appear somewhere in the output — do not omit table data.
+
+TABLE PLACEMENT: Embed table values into the step that logically precedes or introduces that table in the source document. If a table appears after step 5, its values belong in step 5 or as a sub-note immediately after step 5.
+""".strip()
+
+_CONVERT_PLACEHOLDER_RULES = """
+TABLES: The input text marks each table with a line of the form TABLE_PLACEHOLDER_N. The tables themselves are inserted into the document afterwards, exactly as extracted from the PDF. Reproduce every TABLE_PLACEHOLDER_N line exactly as written, on its own line, at the point in the protocol where that table belongs: immediately after the step or paragraph that introduces it. Do not copy, summarize or restate table contents, do not add tables of your own, and do not rename, renumber, merge or drop placeholders.
+""".strip()
+
+CONVERT_RULES = _CONVERT_COMMON_RULES + "\n\n" + _CONVERT_TABLE_RULES
+CONVERT_PLACEHOLDER_RULES = _CONVERT_COMMON_RULES + "\n\n" + _CONVERT_PLACEHOLDER_RULES
+
+_CONVERT_PART_NOTE = (
+    "DOCUMENT PART: The input text is part {index} of {count} of a longer document. "
+    "The other parts are converted separately and joined after yours, so convert only this part. "
+    "{title_rule} If the part begins in the middle of a section, start directly with that "
+    "section's content and steps without a heading. Do not add a Review Checklist."
+)
+_CONVERT_PREFIX = "{rules}\n\n--- CONTRACT ---\n{contract}\n\n"
+_CONVERT_SUFFIX = "{part_note}--- INPUT TEXT ---\n{text}"
+
+FLAG_INSTRUCTIONS = """
+You are a scientific QA reviewer. Your job is to flag risk, not to rewrite.
+
+Given:
+1) SOURCE TEXT (from a PDF extraction)
+2) GENERATED PROTOCOL (Markdown)
+
+Return a Markdown report with these sections:
+
+## Critical Parameters Checklist (from the protocol)
+List the key numeric parameters present in the generated protocol (e.g., temperatures, times, volumes, concentrations, rpm/RCF, CO2/O2).
+If a category is not present, say "MISSING".
+
+## Potential Missing Parameters (compare to source)
+Identify parameters that appear in the SOURCE TEXT but are missing or unclear in the GENERATED PROTOCOL.
+Only cite items that are supported by the SOURCE TEXT.
+
+## Possible Unsupported Claims
+List any statements in the GENERATED PROTOCOL that are NOT clearly supported by the SOURCE TEXT.
+If none, say "None detected".
+
+## Step Order / Omission Risks
+Call out any suspected omitted steps or ordering changes.
+If none, say "None detected".
+
+Rules:
+- Be conservative.
+- If unsure, label as "[CHECK]" instead of asserting.
+- Use short bullet points.
+""".strip()
+
+_FLAG_PREFIX = "{instructions}\n\n"
+_FLAG_SUFFIX = "--- SOURCE TEXT ---\n{source}\n\n--- GENERATED PROTOCOL ---\n{protocol}"
+
+VISION_INSTRUCTIONS = (
+    "This page contains one or more tables. Extract each table you see and "
+    "return them as markdown pipe-formatted tables, one after another, separated "
+    "by a blank line. Include the header row and a separator row of dashes. "
+    "Return only the markdown tables, nothing else."
+)
+# Message content order: the instructions, then the image
+_VISION_LAYOUT = "text,image_url"
+
+
+def _version(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:12]
+
+
+CONVERT_VERSION = _version(CONVERT_RULES, CONVERT_PLACEHOLDER_RULES, _CONVERT_PART_NOTE, _CONVERT_PREFIX, _CONVERT_SUFFIX)
+FLAG_VERSION = _version(FLAG_INSTRUCTIONS, _FLAG_PREFIX, _FLAG_SUFFIX)
+VISION_VERSION = _version(VISION_INSTRUCTIONS, _VISION_LAYOUT)
+
+FLAG_PREFIX = _FLAG_PREFIX.format(instructions=FLAG_INSTRUCTIONS)
+
+
+@lru_cache(maxsize=8)
+def convert_prefix(contract: str, placeholders: bool = False) -> str:
+    """The static start of every conversion prompt for this contract."""
+    rules = CONVERT_PLACEHOLDER_RULES if placeholders else CONVERT_RULES
+    return _CONVERT_PREFIX.format(rules=rules, contract=contract)
+
+
+def convert_prompt(contract: str, text: str, part: tuple[int, int] = None, placeholders: bool = False) -> str:
+    """The conversion prompt for text (one part of a chunked document when
+    part = (index, count), 1-based).  placeholders: text has its tables
+    replaced by TABLE_PLACEHOLDER_N lines, which the model is to keep."""
+    part_note = ""
+    if part is not None:
+        index, count = part
+        title_rule = "Start with the document title heading." if index == 1 else "Do not repeat the document title."
+        part_note = _CONVERT_PART_NOTE.format(index=index, count=count, title_rule=title_rule) + "\n\n"
+    return (convert_prefix(contract, placeholders) + _CONVERT_SUFFIX.format(part_note=part_note, text=text)).rstrip()
+
+
+def flag_prompt(source: str, protocol: str) -> str:
+    """The flagging prompt comparing protocol against its source text."""
+    return (FLAG_PREFIX + _FLAG_SUFFIX.format(source=source, protocol=protocol)).rstrip()
+
+
+def vision_messages(image_url: str, detail: str) -> list:
+    """Chat messages asking for the tables in the image at image_url."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": VISION_INSTRUCTIONS},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": detail}},
+            ],
+        }
+    ]
+
+
+def cache_hit_rate(input_tokens: int, cached_tokens: int) -> float | None:
+    """Fraction of input tokens served from the provider's prompt cache."""
+    if not input_tokens:
+        return None
+    return round(cached_tokens / input_tokens, 3)
@@ -0,0 +1,155 @@
+"""rate_limit.py
+
+Client-side rate limiting for LLM calls.
+
+RateLimiter holds two token buckets, one for requests per minute and one
+for tokens per minute.  Every call reserves one request plus its estimated
+tokens (prompt length / 4) before it is sent, so parallel workers queue up
+locally instead of sending bursts that come back as 429s.  Once the
+response's real usage is known, the token bucket is corrected with settle().
+
+When the API does answer 429, pause() stops *all* callers sharing the
+limiter until the Retry-After time has passed, and retry_delay() adds
+jitter so the workers don't retry in lockstep.
+
+Limits are per process (batch extraction workers each get their own).
+
+Environment:
+    LLM_RPM   requests per minute (default: 500; 0 disables the limit)
+    LLM_TPM   tokens per minute   (default: 200000; 0 disables the limit)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting: ~4 characters per token."""
+    return max(1, len(text) // 4)
+
+
+def retry_delay(attempt: int, error: BaseException, base: float, cap: float = 60.0) -> float:
+    """Seconds to wait before retry number `attempt` (1-based) after error.
+
+    Honors the server's Retry-After / retry-after-ms header when present;
+    otherwise exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value) * scale
+        except (TypeError, ValueError):
+            continue
+        if 0 <= seconds <= cap:
+            # A little jitter so callers told the same time don't align
+            return seconds + random.uniform(0, min(1.0, base))
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """Refills at rate_per_min/60 per second up to capacity.  reserve() may
+    drive the level negative; the caller then waits for it to refill."""
+
+    def __init__(self, rate_per_min: float, capacity: float = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket; returns seconds until it is covered."""
+        self._refill(now)
+        # A single request larger than the whole bucket only waits for a full one
+        amount = min(amount, self.capacity)
+        self._level -= amount
+        return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def give_back(self, amount: float) -> None:
+        self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min limits shared by threads and coroutines."""
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM):
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of `tokens` estimated tokens may be sent."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        """Async counterpart of acquire()."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int | None) -> None:
+        """Correct the token bucket once a call's real usage is known."""
+        if self._tokens is None or actual is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if actual > estimated:
+                self._tokens.reserve(actual - estimated, now)
+            else:
+                self._tokens.give_back(estimated - actual)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def _env_limit(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Return the process-wide limiter configured from the environment, or
+    None when both limits are disabled."""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            rpm = _env_limit("LLM_RPM", DEFAULT_RPM)
+            tpm = _env_limit("LLM_TPM", DEFAULT_TPM)
+            if rpm <= 0 and tpm <= 0:
+                return None
+            _default_limiter = RateLimiter(rpm, tpm)
+        return _default_limiter
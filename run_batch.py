@@ -1,11 +1,18 @@
 import argparse
+import asyncio
 import base64
+import hashlib
 import io
 import json
 import logging
+import math
+import os
 import re
+import threading
 import time
 import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -13,8 +20,16 @@ logger = logging.getLogger(__name__)
 import pdfplumber
 from docx import Document
 from docx.shared import Pt
+from pdfminer.pdftypes import PDFStream, resolve1
 from dotenv import load_dotenv
-from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, RateLimitError
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
+
+import instrument
+import prompts
+from llm_backend import backend_name, make_client
+from llm_cache import cache_key, get_llm_cache, get_vision_cache
+from rate_limit import estimate_tokens, get_rate_limiter, retry_delay
+from stage_graph import StageError, StageGraph
 
 # -------------------------
 # Paths
@@ -30,7 +45,25 @@ MODEL_CONVERT = "gpt-4.1-mini"
 MODEL_FLAG = "gpt-4.1-mini"
 MAX_INPUT_CHARS = 120_000  # safety limit to avoid huge uploads by accident
 MAX_RETRIES = 5
-RETRY_BASE_DELAY = 2  # seconds; doubled each attempt
+RETRY_BASE_DELAY = 2  # seconds; backoff ceiling doubles each attempt (jittered)
+RETRY_MAX_DELAY = 60  # seconds
+MIN_PAGES_PER_WORKER = 4  # page-parallel extraction: smaller ranges aren't worth a process
+# Longer inputs are converted section-wise in parallel chunks; by default
+# only those that would otherwise be truncated at MAX_INPUT_CHARS
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", str(MAX_INPUT_CHARS)))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "4"))  # concurrent LLM calls per document when chunked
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))  # concurrent vision-fallback requests per document
+# Opt-in: send tables to the model as TABLE_PLACEHOLDER_N lines and render
+# them into the DOCX from the extracted rows (default: the model inlines them)
+TABLE_PLACEHOLDERS = os.getenv("TABLE_PLACEHOLDERS", "0").strip().lower() in ("1", "true", "yes", "on")
+# Opt-in: drop running headers/footers, page numbers and page markers before
+# the text is cleaned and sent to the model (see strip_page_boilerplate)
+STRIP_BOILERPLATE = os.getenv("STRIP_BOILERPLATE", "0").strip().lower() in ("1", "true", "yes", "on")
+
+# Prompt versions (hashes of the templates in prompts.py) key the LLM cache,
+# so cached results are not reused after a prompt changes
+CONVERT_PROMPT_VERSION = prompts.CONVERT_VERSION
+FLAG_PROMPT_VERSION = prompts.FLAG_VERSION
 
 # Always append this (deterministic), regardless of what the model outputs
 REVIEW_CHECKLIST_MD = """
@@ -137,84 +170,191 @@ def _fallback_table_rows(page, bbox: tuple):
     return rows
 
 
-def _extract_tables_via_vision(page, client: OpenAI) -> list:
-    """Extract tables from a page image using GPT-4o-mini vision.
+_VISION_MODEL = "gpt-4o-mini"
+_VISION_PROMPT = prompts.VISION_INSTRUCTIONS
+# Vision images: the corrupted tables' area is cropped (plus a margin) and
+# rendered at the highest DPI in [MIN, MAX] the model will actually use (at
+# detail=high it scales images to fit 2048px, then the short side to 768px)
+_VISION_CROP_MARGIN = 12  # points
+_VISION_MIN_DPI = 72
+_VISION_MAX_DPI = 200
+_VISION_TILE = 512  # px; detail=high costs 85 + 170 tokens per tile
+_VISION_TILE_FIT = 0.85  # shrink up to this factor to drop a partial tile row/column
+_VISION_RENDER_VERSION = 1  # bump when the rendering policy changes (cache key)
+
+# Vision upload totals for this process (see vision_totals)
+_vision_totals = {"requests": 0, "upload_bytes": 0, "seconds": 0.0}
+
+
+def _vision_render_params(page, bboxes: list) -> dict:
+    """Crop box and DPI for the vision image of a page's corrupted tables."""
+    x0 = max(page.bbox[0], min(b[0] for b in bboxes) - _VISION_CROP_MARGIN)
+    top = max(page.bbox[1], min(b[1] for b in bboxes) - _VISION_CROP_MARGIN)
+    x1 = min(page.bbox[2], max(b[2] for b in bboxes) + _VISION_CROP_MARGIN)
+    bottom = min(page.bbox[3], max(b[3] for b in bboxes) + _VISION_CROP_MARGIN)
+    width, height = max(x1 - x0, 1.0), max(bottom - top, 1.0)
+    dpi = min(_VISION_MAX_DPI, 768 * 72 / min(width, height), 2048 * 72 / max(width, height))
+    return {
+        "bbox": (round(x0, 1), round(top, 1), round(x1, 1), round(bottom, 1)),
+        "resolution": int(max(_VISION_MIN_DPI, dpi)),
+    }
+
+
+def _fit_to_tiles(img):
+    """Shrink img slightly if that saves a partial 512px tile row/column."""
+    scale = 1.0
+    for size in img.size:
+        tiles = math.ceil(size / _VISION_TILE)
+        fitted = (tiles - 1) * _VISION_TILE
+        if fitted and fitted / size >= _VISION_TILE_FIT:
+            scale = min(scale, fitted / size)
+    if scale < 1.0:
+        img = img.resize((max(1, int(img.size[0] * scale)), max(1, int(img.size[1] * scale))))
+    return img
 
-    Renders the page as a JPEG at 150 DPI, sends it to the OpenAI chat
-    completions API, and parses the markdown table response into a list of
-    row-lists (one list per table found on the page).  Returns an empty list
-    on any rendering or API error.
 
+def _render_vision_image(page, params: dict) -> dict:
+    """Render the crop described by params (see _vision_render_params) as a
+    grayscale JPEG for the vision fallback.
+
+    Returns {'b64', 'detail', 'tokens', 'bytes'}: images that fit in one tile
+    are sent at detail=low (a flat 85 tokens); larger ones at detail=high,
+    with slightly lower JPEG quality once they span several tiles.
     Requires the 'pillow' and 'pikepdf' packages for page.to_image().
     """
-    logger.info("Vision fallback triggered for page %s", getattr(page, 'page_number', '?'))
-    try:
-        try:
-            pil_image = page.to_image(resolution=150).original
-            buf = io.BytesIO()
-            pil_image.save(buf, format="JPEG")
-            b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-        except Exception:
-            logger.error("Vision fallback: page render/encode failed:\n%s", traceback.format_exc())
-            return []
+    img = page.crop(params["bbox"]).to_image(resolution=params["resolution"]).original
+    img = _fit_to_tiles(img.convert("L"))
+    width, height = img.size
+    tiles = math.ceil(width / _VISION_TILE) * math.ceil(height / _VISION_TILE)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85 if tiles <= 2 else 75, optimize=True)
+    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+    low = tiles == 1
+    return {
+        "b64": b64,
+        "detail": "low" if low else "high",
+        "tokens": 85 if low else 85 + 170 * tiles,
+        "bytes": len(b64),
+    }
 
-        prompt = (
-            "This page contains one or more tables. Extract each table you see and "
-            "return them as markdown pipe-formatted tables, one after another, separated "
-            "by a blank line. Include the header row and a separator row of dashes. "
-            "Return only the markdown tables, nothing else."
-        )
 
+def _record_vision_upload(image: dict, seconds: float) -> None:
+    with _usage_lock:
+        _vision_totals["requests"] += 1
+        _vision_totals["upload_bytes"] += image["bytes"]
+        _vision_totals["seconds"] += seconds
+
+
+def vision_totals() -> dict:
+    """Return a snapshot of the vision request totals (upload bytes, seconds)."""
+    with _usage_lock:
+        return dict(_vision_totals)
+
+
+def _vision_messages(image: dict) -> list:
+    return prompts.vision_messages(f"data:image/jpeg;base64,{image['b64']}", image["detail"])
+
+
+def _page_fingerprint(page) -> str:
+    """Hash what a page renders from: its size, content streams and the
+    XObjects (images, forms) they draw, recursively.  Identical pages in
+    different files (or re-runs of the same file) share a fingerprint."""
+    h = hashlib.sha256()
+    page_obj = page.page_obj
+    h.update(repr(page_obj.mediabox).encode("utf-8"))
+    seen: set = set()
+
+    def add_xobjects(resources) -> None:
+        xobjects = resolve1(resolve1(resources or {}).get("XObject")) or {}
+        for name in sorted(xobjects):
+            ref = xobjects[name]
+            objid = getattr(ref, "objid", None)
+            if objid is not None:
+                if objid in seen:
+                    continue
+                seen.add(objid)
+            h.update(str(name).encode("utf-8"))
+            add_stream(ref)
+
+    def add_stream(ref) -> None:
+        stream = resolve1(ref)
+        if isinstance(stream, PDFStream):
+            h.update(stream.get_data() or b"")
+            add_xobjects(stream.get("Resources"))
+
+    for ref in page_obj.contents:
+        add_stream(ref)
+    add_xobjects(page_obj.resources)
+    return h.hexdigest()
+
+
+def _vision_cache_key(page, params: dict) -> str:
+    return cache_key(
+        "vision", _VISION_MODEL, prompts.VISION_VERSION, _VISION_RENDER_VERSION,
+        params["bbox"], params["resolution"], _page_fingerprint(page),
+    )
+
+
+def _parse_vision_tables(response_text: str) -> list:
+    """Parse the vision model's markdown tables into a list of row-lists."""
+    # Split on blank lines; treat each chunk containing a pipe as a table
+    all_tables = []
+    for chunk in re.split(r"\n\s*\n", response_text):
+        if "|" not in chunk:
+            continue
+        rows = []
+        for line in chunk.splitlines():
+            line = line.strip()
+            if not line or not line.startswith("|"):
+                continue
+            # Skip separator rows (| --- | --- |)
+            if re.match(r"^[\s\-|:]+$", line.strip("|")):
+                continue
+            cells = [c.strip() for c in line.split("|")[1:-1]]
+            rows.append(cells)
+        if rows:
+            all_tables.append(rows)
+    return all_tables
+
+
+def _extract_tables_via_vision(image: dict, client: OpenAI, page_number=None) -> list:
+    """Extract tables from a page image using GPT-4o-mini vision.
+
+    Sends the image (from _render_vision_image) to the OpenAI chat
+    completions API and parses the markdown table response into a list of
+    row-lists (one list per table found).  Returns an empty list on any API
+    error.
+    """
+    page_number = page_number if page_number is not None else "?"
+    logger.info("Vision fallback triggered for page %s", page_number)
+    try:
+        t0 = time.time()
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{b64}",
-                                    "detail": "high",
-                                },
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt,
-                            },
-                        ],
-                    }
-                ],
-            )
+            with instrument.span(
+                "vision", page=page_number, model=_VISION_MODEL,
+                upload_bytes=image["bytes"], detail=image["detail"], image_tokens=image["tokens"],
+            ):
+                resp = _create_with_retry(
+                    lambda: client.chat.completions.create(model=_VISION_MODEL, messages=_vision_messages(image)),
+                    estimate_tokens(_VISION_PROMPT) + image["tokens"],
+                )
         except Exception:
             logger.error("Vision fallback: API call failed:\n%s", traceback.format_exc())
             return []
+        seconds = time.time() - t0
+        _record_vision_upload(image, seconds)
+        logger.info(
+            "Vision fallback: page %s uploaded %.0f KB (detail=%s) in %.1fs",
+            page_number, image["bytes"] / 1024, image["detail"], seconds,
+        )
 
         response_text = (resp.choices[0].message.content or "").strip()
         if not response_text:
             logger.error("Vision fallback: API returned empty response")
             return []
 
-        # Split on blank lines; treat each chunk containing a pipe as a table
-        all_tables = []
-        for chunk in re.split(r"\n\s*\n", response_text):
-            if "|" not in chunk:
-                continue
-            rows = []
-            for line in chunk.splitlines():
-                line = line.strip()
-                if not line or not line.startswith("|"):
-                    continue
-                # Skip separator rows (| --- | --- |)
-                if re.match(r"^[\s\-|:]+$", line.strip("|")):
-                    continue
-                cells = [c.strip() for c in line.split("|")[1:-1]]
-                rows.append(cells)
-            if rows:
-                all_tables.append(rows)
-
-        logger.info("Vision fallback: extracted %d table(s) from page %s", len(all_tables), getattr(page, 'page_number', '?'))
+        all_tables = _parse_vision_tables(response_text)
+        logger.info("Vision fallback: extracted %d table(s) from page %s", len(all_tables), page_number)
         return all_tables
 
     except Exception:
@@ -312,7 +452,7 @@ def _sort_tables_reading_order(tables: list) -> list:
     return result
 
 
-def _detect_column_split(page) -> float | None:
+def _detect_column_split(page, words: list = None) -> float | None:
     """Return the x coordinate of the column gap if a two-column layout is
     detected, or None for single-column pages.
 
@@ -323,8 +463,10 @@ def _detect_column_split(page) -> float | None:
        there is a contiguous gap of at least 20 points where no word x0 falls.
 
     Returns the centre of the largest such gap if found, otherwise None.
+    words – pre-extracted page.extract_words() output, to avoid a second pass.
     """
-    words = page.extract_words()
+    if words is None:
+        words = page.extract_words()
     if not words:
         return None
 
@@ -360,6 +502,122 @@ def _detect_column_split(page) -> float | None:
     return (best_lo + best_hi) / 2
 
 
+class _PageAnalysis:
+    """A single, memoized parse of one pdfplumber page.
+
+    Text extraction and table extraction both need the page's words, its
+    tables and the text of various regions.  Each of those is computed on
+    first use and reused, so column detection, page text, table rows and
+    heading tracking all share one parse instead of re-walking the page.
+
+    All text is extracted with x_tolerance=3, y_tolerance=3 (pdfplumber's
+    defaults), so a region requested by both passes is only extracted once.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.page_number = page.page_number
+        self.width = page.width
+        self.height = page.height
+        self._words = None
+        self._tables = None
+        self._table_rows: dict[int, list] = {}
+        self._column_split = None
+        self._column_split_done = False
+        self._text: dict[tuple, str] = {}
+
+    @property
+    def words(self) -> list:
+        if self._words is None:
+            self._words = self.page.extract_words()
+        return self._words
+
+    @property
+    def tables(self) -> list:
+        """pdfplumber Table objects in reading order."""
+        if self._tables is None:
+            with instrument.span("find_tables", page=self.page_number) as s:
+                self._tables = _sort_tables_reading_order(self.page.find_tables())
+                s["tables"] = len(self._tables)
+        return self._tables
+
+    def table_rows(self, table) -> list:
+        key = id(table)
+        if key not in self._table_rows:
+            self._table_rows[key] = table.extract()
+        return self._table_rows[key]
+
+    @property
+    def column_split(self) -> float | None:
+        if not self._column_split_done:
+            words = self.words
+            with instrument.span("column_detect", page=self.page_number) as s:
+                self._column_split = _detect_column_split(self.page, words)
+                s["two_column"] = self._column_split is not None
+            self._column_split_done = True
+        return self._column_split
+
+    def text(self, bbox: tuple = None) -> str:
+        """Text of the page, or of the (x0, top, x1, bottom) region bbox."""
+        key = bbox or (0, 0, self.width, self.height)
+        if key not in self._text:
+            region = self.page if bbox is None else self.page.crop(bbox)
+            self._text[key] = region.extract_text(x_tolerance=3, y_tolerance=3) or ""
+        return self._text[key]
+
+    def band_text(self, top: float, bottom: float) -> str:
+        """Full-width text between two y coordinates."""
+        if top <= 0 and bottom >= self.height:
+            return self.text()
+        return self.text((0, top, self.width, bottom))
+
+    def content(self) -> str:
+        """Page text in reading order, handling two-column layouts."""
+        split_x = self.column_split
+        if split_x is not None:
+            left_text = self.text((0, 0, split_x, self.height))
+            right_text = self.text((split_x, 0, self.width, self.height))
+            return (left_text + "\n\n" + right_text).strip()
+        return self.text()
+
+    def content_with_placeholders(self) -> str:
+        """Like content(), but each table with rows becomes a
+        TABLE_PLACEHOLDER_<k> line, k numbering the page's tables in reading
+        order (as in _page_tables).  The text around the tables is kept, top
+        to bottom within each column."""
+        tables = [t for t in self.tables if self.table_rows(t)]
+        if not tables:
+            return self.content()
+        text_page = self.page
+        for table in tables:
+            text_page = text_page.outside_bbox(table.bbox)
+
+        def band(x0, top, x1, bottom) -> str:
+            # By centre point, so a line straddling a table's top lands in one band only
+            def inside(obj) -> bool:
+                return x0 <= (obj["x0"] + obj["x1"]) / 2 < x1 and top <= (obj["top"] + obj["bottom"]) / 2 < bottom
+
+            if bottom - top < 1:
+                return ""
+            return text_page.filter(inside).extract_text(x_tolerance=3, y_tolerance=3) or ""
+
+        split_x = self.column_split
+        columns = [(0, self.width)] if split_x is None else [(0, split_x), (split_x, self.width)]
+        blocks = []
+        for x0, x1 in columns:
+            in_column = sorted(
+                ((k, t) for k, t in enumerate(tables, start=1) if x0 <= (t.bbox[0] + t.bbox[2]) / 2 < x1),
+                key=lambda kt: kt[1].bbox[1],
+            )
+            top = 0.0
+            for k, table in in_column:
+                blocks.append(band(x0, top, x1, table.bbox[1]))
+                blocks.append(f"TABLE_PLACEHOLDER_{k}")
+                top = max(top, table.bbox[1])
+            blocks.append(band(x0, top, x1, self.height))
+        return "\n\n".join(b.strip() for b in blocks if b.strip())
+
+
 def _extract_page_content(page, client: OpenAI) -> str:
     """Extract text from a page, handling two-column layouts automatically.
 
@@ -368,14 +626,7 @@ def _extract_page_content(page, client: OpenAI) -> str:
     and each half is extracted separately, preserving column reading order.
     Single-column pages are extracted normally.
     """
-    split_x = _detect_column_split(page)
-    if split_x is not None:
-        left = page.crop((0, 0, split_x, page.height))
-        right = page.crop((split_x, 0, page.width, page.height))
-        left_text = left.extract_text(x_tolerance=3, y_tolerance=3) or ""
-        right_text = right.extract_text(x_tolerance=3, y_tolerance=3) or ""
-        return (left_text + "\n\n" + right_text).strip()
-    return page.extract_text(x_tolerance=3, y_tolerance=3) or ""
+    return _PageAnalysis(page).content()
 
 
 def _extract_page_content_with_placeholders(page, counter_start: int) -> tuple:
@@ -439,7 +690,301 @@ def _looks_like_heading(line: str) -> bool:
     return True
 
 
-def extract_tables_from_pdf(pdf_path: Path, client: OpenAI) -> list:
+def _page_tables(analysis: _PageAnalysis) -> tuple[list, str | None]:
+    """Collect the tables on one analysed page.
+
+    Pages are independent apart from the heading tracker, so headings are
+    tracked locally: each table's 'section_heading' is the last heading-like
+    line seen on this page above it, or None if there was none (the caller
+    fills in the heading carried over from earlier pages, see
+    _resolve_section_headings).  Returns (table_dicts, last_heading_on_page).
+
+    Corrupted tables (_is_corrupted_table) are returned with 'corrupted':
+    True and their pdfplumber rows; _apply_vision_fallback replaces them
+    with vision results (or drops them) once all pages are analysed.
+    """
+    tables: list[dict] = []
+    page_num = analysis.page_number
+    tables_on_page = analysis.tables
+    current_heading = None
+
+    if not tables_on_page:
+        # No tables on this page — scan full text to advance heading tracker
+        for line in analysis.text().splitlines():
+            if _looks_like_heading(line):
+                current_heading = line.strip()
+        return tables, current_heading
+
+    prev_bottom = 0.0
+    for table in tables_on_page:
+        top = table.bbox[1]
+        preceding = ""
+        if top > prev_bottom:
+            preceding = analysis.band_text(prev_bottom, top)
+        # Advance heading tracker from text above this table
+        for line in preceding.splitlines():
+            if _looks_like_heading(line):
+                current_heading = line.strip()
+        rows = analysis.table_rows(table)
+        if rows:
+            td = {
+                "page": page_num,
+                "top": top,
+                "rows": rows,
+                "preceding_text": preceding.strip(),
+                "section_heading": current_heading,
+            }
+            if _is_corrupted_table(rows):
+                td["corrupted"] = True
+                td["bbox"] = tuple(table.bbox)
+            tables.append(td)
+        prev_bottom = table.bbox[3]
+
+    # Scan text after the last table on this page to keep tracker current
+    if prev_bottom < analysis.height:
+        for line in analysis.band_text(prev_bottom, analysis.height).splitlines():
+            if _looks_like_heading(line):
+                current_heading = line.strip()
+
+    return tables, current_heading
+
+
+def _prepare_vision(page, result: dict) -> None:
+    """Set up the vision fallback for a page with corrupted tables: use the
+    cached tables for this page fingerprint and crop if any
+    ('vision_tables'), otherwise render the crop ('vision_image').
+    'vision_key' is where _apply_vision_fallback stores a fresh result."""
+    params = _vision_render_params(page, [td["bbox"] for td in result["tables"] if td.get("corrupted")])
+    cache = get_vision_cache()
+    if cache is not None:
+        try:
+            result["vision_key"] = _vision_cache_key(page, params)
+        except Exception:
+            logger.warning("Vision cache: could not fingerprint page %s:\n%s", result["page"], traceback.format_exc())
+        else:
+            cached = cache.get(result["vision_key"])
+            if cached is not None:
+                result["vision_tables"] = json.loads(cached)
+                return
+    try:
+        with instrument.span("vision_render", page=result["page"]) as s:
+            result["vision_image"] = _render_vision_image(page, params)
+            s.update(upload_bytes=result["vision_image"]["bytes"], detail=result["vision_image"]["detail"])
+    except Exception:
+        logger.error("Vision fallback: page render/encode failed:\n%s", traceback.format_exc())
+
+
+def _analyze_page(page, with_text: bool, with_tables: bool, with_vision: bool = False, placeholders: bool = False) -> dict:
+    """Extract one page's content and/or tables into a picklable result dict:
+    {'page', 'content', 'tables', 'last_heading', 'vision_image', 'spans'}.
+
+    When with_vision is set and the page has corrupted tables, the page is
+    also prepared for the vision fallback (see _prepare_vision).  'spans'
+    holds the page's instrumentation spans, so they survive a process pool.
+
+    placeholders (with with_tables): the content has each table replaced
+    by a page-local TABLE_PLACEHOLDER_<slot> line, each table dict records
+    its 'slot', and corrupted tables keep their region's text as
+    'fallback_text' in case the vision fallback cannot replace them.
+    """
+    analysis = _PageAnalysis(page)
+    result = {"page": analysis.page_number, "content": "", "tables": [], "last_heading": None, "vision_image": None}
+    with instrument.recording() as rec, instrument.span("page", page=analysis.page_number):
+        if with_text:
+            result["content"] = analysis.content_with_placeholders() if placeholders else analysis.content()
+        if with_tables:
+            result["tables"], result["last_heading"] = _page_tables(analysis)
+            if placeholders:
+                for slot, td in enumerate(result["tables"], start=1):
+                    td["slot"] = slot
+                    if td.get("corrupted"):
+                        td["fallback_text"] = analysis.text(td["bbox"]).strip()
+            if with_vision and any(td.get("corrupted") for td in result["tables"]):
+                _prepare_vision(page, result)
+        # Release the page's parsed objects before moving on
+        page.close()
+    result["spans"] = rec.raw
+    return result
+
+
+def _extract_page_range(
+    pdf_path: Path, start: int, end: int, with_text: bool, with_tables: bool, with_vision: bool = False, placeholders: bool = False,
+) -> list:
+    """Process-pool entry point: analyse pages[start:end] of the PDF.
+
+    Workers make no API calls: vision requests for corrupted tables are
+    issued by the parent (_apply_vision_fallback).
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        return [_analyze_page(page, with_text, with_tables, with_vision, placeholders) for page in pdf.pages[start:end]]
+
+
+def _page_ranges(n_pages: int, workers: int) -> list[tuple[int, int]]:
+    """Split n_pages into at most `workers` contiguous ranges of at least
+    MIN_PAGES_PER_WORKER pages each."""
+    n_ranges = max(1, min(workers, n_pages // MIN_PAGES_PER_WORKER))
+    size, extra = divmod(n_pages, n_ranges)
+    ranges, start = [], 0
+    for k in range(n_ranges):
+        end = start + size + (1 if k < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _resolve_section_headings(page_results: list) -> list:
+    """Sequential pass over per-page results (in page order): fill in each
+    table's section_heading from the heading carried across pages, and return
+    the flattened table list."""
+    tables: list[dict] = []
+    current_heading = ""
+    for result in page_results:
+        for td in result["tables"]:
+            if td["section_heading"] is None:
+                td["section_heading"] = current_heading
+            tables.append(td)
+        if result["last_heading"] is not None:
+            current_heading = result["last_heading"]
+    return tables
+
+
+def _apply_vision_results(page_results: list, vision_results: dict) -> None:
+    """Replace each corrupted table with its matching vision table, dropping
+    those without a match.  vision_results maps page number to that page's
+    vision tables."""
+    for result in page_results:
+        for key in ("vision_image", "vision_key", "vision_tables"):
+            result.pop(key, None)
+        if not any(td.get("corrupted") for td in result["tables"]):
+            continue
+        page_vision = vision_results.get(result["page"], [])
+        used_indices: set = set()
+        tables = []
+        for td in result["tables"]:
+            td.pop("bbox", None)
+            if td.pop("corrupted", False):
+                match_idx = _match_vision_result(td["rows"], page_vision, used_indices)
+                if match_idx is None or not page_vision[match_idx]:
+                    if "fallback_text" in td:
+                        # Placeholder mode: its text goes back in place of the placeholder
+                        td["rows"] = None
+                        tables.append(td)
+                    # Otherwise no matching vision result; skip this corrupted table
+                    continue
+                used_indices.add(match_idx)
+                td["rows"] = page_vision[match_idx]
+            tables.append(td)
+        result["tables"] = tables
+
+
+def _apply_vision_fallback(page_results: list, client: OpenAI, max_concurrency: int = VISION_CONCURRENCY) -> None:
+    """Second pass over analysed pages: one vision request per page with
+    corrupted tables, issued concurrently (at most max_concurrency at once),
+    then matched to the corrupted tables (see _apply_vision_results).
+    Pages answered from the vision cache need no request; fresh non-empty
+    results are added to it."""
+    vision_results = {r["page"]: r["vision_tables"] for r in page_results if "vision_tables" in r}
+    pending = [r for r in page_results if r.get("vision_image")]
+    if pending and client is not None:
+        t0 = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(pending))), thread_name_prefix="vision") as pool:
+            futures = {
+                r["page"]: pool.submit(instrument.bind(_extract_tables_via_vision), r["vision_image"], client, r["page"])
+                for r in pending
+            }
+            vision_results.update((page, fut.result()) for page, fut in futures.items())
+        logger.info("Vision fallback: %d page(s) in %.1fs", len(pending), time.time() - t0)
+        cache = get_vision_cache()
+        for r in pending:
+            # Empty results are not cached: they also stand for failed requests
+            if cache is not None and r.get("vision_key") and vision_results[r["page"]]:
+                cache.put(r["vision_key"], json.dumps(vision_results[r["page"]]))
+    _apply_vision_results(page_results, vision_results)
+
+
+def _extract_pages(pdf_path: Path, client: OpenAI, with_text: bool, with_tables: bool, workers: int, placeholders: bool = False) -> list:
+    """Analyse every page of the PDF and return the per-page result dicts in
+    page order, optionally spreading page ranges over a process pool.  The
+    vision fallback for corrupted tables runs afterwards, concurrently across
+    pages."""
+    with_tables = with_tables or placeholders
+    with_vision = with_tables and client is not None
+    with instrument.span("pdf_open", file=Path(pdf_path).name) as s:
+        pdf = pdfplumber.open(pdf_path)
+        s["pages"] = len(pdf.pages)
+    with pdf:
+        ranges = _page_ranges(len(pdf.pages), workers)
+        if len(ranges) == 1:
+            page_results = [_analyze_page(page, with_text, with_tables, with_vision, placeholders) for page in pdf.pages]
+
+    if len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [
+                pool.submit(_extract_page_range, pdf_path, start, end, with_text, with_tables, with_vision, placeholders)
+                for start, end in ranges
+            ]
+            page_results = [result for fut in futures for result in fut.result()]
+
+    for result in page_results:
+        instrument.extend(result.pop("spans"))
+    if with_tables:
+        _apply_vision_fallback(page_results, client)
+    return page_results
+
+
+def extract_pdf_content(
+    pdf_path: Path, client: OpenAI, with_tables: bool = True, workers: int = 1, placeholders: bool = False,
+) -> tuple[str, list]:
+    """Extract page text and tables in a single pass over the PDF.
+
+    Every page is analysed once (_PageAnalysis); the text and table passes
+    share its words, tables and region text.  Returns (text, tables) in the
+    formats of extract_text_from_pdf and extract_tables_from_pdf.
+    with_tables=False skips table finding.
+
+    placeholders=True takes the tables out of the text instead: each one is
+    replaced by a TABLE_PLACEHOLDER_N line, numbered through the document,
+    and tables[N - 1] holds its rows (see md_to_docx).  A corrupted table
+    the vision fallback could not replace keeps its text in place.
+
+    workers > 1 splits the pages into contiguous ranges handled by a process
+    pool (each worker opens the file itself); page text is then stitched and
+    section headings resolved in a cheap sequential pass.  Short documents
+    are processed in-process regardless.
+    """
+    page_results = _extract_pages(pdf_path, client, True, with_tables, workers, placeholders)
+    if placeholders:
+        _resolve_section_headings(page_results)
+        return _number_table_placeholders(page_results)
+    text = "".join(f"\n\n--- PAGE {i} ---\n\n{r['content']}" for i, r in enumerate(page_results, start=1))
+    tables = _resolve_section_headings(page_results) if with_tables else []
+    return text.strip(), tables
+
+
+def _number_table_placeholders(page_results: list) -> tuple[str, list]:
+    """Stitch page contents whose tables are page-local placeholders into the
+    document text with TABLE_PLACEHOLDER_N numbered in order of appearance.
+    Returns (text, tables), tables[N - 1] being placeholder N's table."""
+    tables: list[dict] = []
+    pages: list[str] = []
+    for i, result in enumerate(page_results, start=1):
+        by_slot = {td.pop("slot"): td for td in result["tables"]}
+
+        def number(m: re.Match) -> str:
+            td = by_slot.get(int(m.group(1)[len("TABLE_PLACEHOLDER_"):]))
+            if td is None:
+                return ""
+            fallback_text = td.pop("fallback_text", "")
+            if td["rows"] is None:
+                return fallback_text
+            tables.append(td)
+            return f"TABLE_PLACEHOLDER_{len(tables)}"
+
+        pages.append(f"\n\n--- PAGE {i} ---\n\n{_PLACEHOLDER_LINE_RE.sub(number, result['content'])}")
+    return "".join(pages).strip(), tables
+
+
+def extract_tables_from_pdf(pdf_path: Path, client: OpenAI, workers: int = 1) -> list:
     """Return all tables from the PDF in page/vertical order as raw row data.
 
     Each entry is a dict with:
@@ -449,80 +994,16 @@ def extract_tables_from_pdf(pdf_path: Path, client: OpenAI) -> list:
       'preceding_text' – text on the same page immediately above the table
       'section_heading'– most recent heading-like line seen before this table
                          across the full document, used for section matching
-    """
-    tables: list[dict] = []
-    current_heading = ""
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            tables_on_page = _sort_tables_reading_order(page.find_tables())
-
-            if not tables_on_page:
-                # No tables on this page — scan full text to advance heading tracker
-                for line in (page.extract_text() or "").splitlines():
-                    if _looks_like_heading(line):
-                        current_heading = line.strip()
-                continue
 
-            prev_bottom = 0.0
-            _vision_results = None  # lazily populated; shared across corrupted tables on page
-            _used_vision_indices: set = set()
-            for table in tables_on_page:
-                top = table.bbox[1]
-                preceding = ""
-                if top > prev_bottom:
-                    crop = page.crop((0, prev_bottom, page.width, top))
-                    preceding = crop.extract_text() or ""
-                # Advance heading tracker from text above this table
-                for line in preceding.splitlines():
-                    if _looks_like_heading(line):
-                        current_heading = line.strip()
-                rows = table.extract()
-                if rows:
-                    if _is_corrupted_table(rows):
-                        if _vision_results is None:
-                            _vision_results = _extract_tables_via_vision(page, client)
-                        match_idx = _match_vision_result(rows, _vision_results, _used_vision_indices)
-                        if match_idx is not None:
-                            _used_vision_indices.add(match_idx)
-                            vt_rows = _vision_results[match_idx]
-                            if vt_rows:
-                                tables.append({
-                                    "page": page_num,
-                                    "top": top,
-                                    "rows": vt_rows,
-                                    "preceding_text": preceding.strip(),
-                                    "section_heading": current_heading,
-                                })
-                        # else: no matching vision result; skip this corrupted table
-                    else:
-                        tables.append({
-                            "page": page_num,
-                            "top": top,
-                            "rows": rows,
-                            "preceding_text": preceding.strip(),
-                            "section_heading": current_heading,
-                        })
-                prev_bottom = table.bbox[3]
-
-            # Scan text after the last table on this page to keep tracker current
-            if prev_bottom < page.height:
-                remaining = page.crop((0, prev_bottom, page.width, page.height))
-                for line in (remaining.extract_text() or "").splitlines():
-                    if _looks_like_heading(line):
-                        current_heading = line.strip()
-
-    return tables
+    Callers that also need the page text should use extract_pdf_content.
+    """
+    return _resolve_section_headings(_extract_pages(pdf_path, client, False, True, workers))
 
 
-def extract_text_from_pdf(pdf_path: Path, client: OpenAI) -> str:
+def extract_text_from_pdf(pdf_path: Path, client: OpenAI, workers: int = 1) -> str:
     """Extract page text with tables interleaved by vertical position."""
-    parts: list[str] = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages, start=1):
-            content = _extract_page_content(page, client)
-            parts.append(f"\n\n--- PAGE {i} ---\n\n{content}")
-    return "".join(parts).strip()
+    text, _ = extract_pdf_content(pdf_path, client, with_tables=False, workers=workers)
+    return text
 
 
 # -------------------------
@@ -576,13 +1057,108 @@ def clean_text_preserving_placeholders(raw: str) -> str:
             result_parts.append(clean_text(seg))
     return "".join(result_parts).strip()
 
+
+_PAGE_MARKER_RE = re.compile(r"^--- PAGE (\d+) ---$", re.MULTILINE)
+_BOILERPLATE_EDGE_LINES = 3  # non-blank lines examined at the top and at the bottom of each page
+_BOILERPLATE_MAX_CHARS = 120  # longer lines are content, not page furniture
+_BOILERPLATE_MIN_PAGES = 3
+_BOILERPLATE_MIN_SHARE = 0.3  # of the document's pages; running heads can alternate left/right
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+# What changes from page to page in a running header/footer: page numbers
+# ("Page 3", "Page 3 of 12") and dates.  Other numbers are left alone, so
+# "Passage 3" and "Passage 4" stay different lines.
+_PAGE_TOKEN_RE = re.compile(
+    r"\bpage\s*\d+(?:\s*(?:of|/)\s*\d+)?\b"
+    r"|\b\d{1,4}[./-]\d{1,2}[./-]\d{1,4}\b"
+    rf"|\b\d{{1,2}}\s*{_MONTH},?\s*\d{{4}}\b"
+    rf"|\b{_MONTH}\s*(?:\d{{1,2}},?\s*)?\d{{4}}\b"
+)
+_PAGE_NUMBER_LINE_RE = re.compile(
+    r"[\d\s./|()\-\u2013\u2014]*\d[\d\s./|()\-\u2013\u2014]*"  # 3, - 3 -, 3/12
+    r"|\d+ of \d+"
+    r"|(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"  # roman page numbers
+)
+
+
+def _boilerplate_key(line: str) -> str | None:
+    """What a running header/footer line has in common across pages: case
+    and spacing folded, page numbers and dates as '#' (a line that is only a
+    page number becomes '#').  None for lines that never count: blank,
+    placeholders, and anything longer than _BOILERPLATE_MAX_CHARS."""
+    line = " ".join(line.split()).lower()
+    if not line or len(line) > _BOILERPLATE_MAX_CHARS or _PLACEHOLDER_LINE_RE.match(line.upper()):
+        return None
+    if _PAGE_NUMBER_LINE_RE.fullmatch(line):
+        return "#"
+    return _PAGE_TOKEN_RE.sub("#", line)
+
+
+def _edge_lines(lines: list[str], side: str) -> list[tuple[int, tuple]]:
+    """(index, (side, offset, key)) of the first _BOILERPLATE_EDGE_LINES
+    non-blank lines from the top or bottom of a page.  The offset is counted
+    from that edge, so a line only ever matches lines in the same place on
+    other pages."""
+    indices = [i for i, line in enumerate(lines) if line.strip()]
+    if side == "bottom":
+        indices.reverse()
+    return [
+        (i, (side, offset, _boilerplate_key(lines[i])))
+        for offset, i in enumerate(indices[:_BOILERPLATE_EDGE_LINES])
+    ]
+
+
+def strip_page_boilerplate(raw: str) -> tuple[str, dict]:
+    """Remove page furniture from extract_text_from_pdf output.
+
+    A line counts as boilerplate when its _boilerplate_key occurs at the same
+    offset from the top or bottom of at least 30% of the pages (and of 3 or
+    more): running headers and footers, copyright and contact lines, page
+    numbers.  Such lines are removed; the --- PAGE N --- markers go too.
+
+    Returns (text, removed): removed summarises what was dropped for the run
+    log, with one span per header/footer line and the pages it was on.
+    """
+    parts = _PAGE_MARKER_RE.split(raw)
+    numbers = [int(n) for n in parts[1::2]]
+    pages = [body.split("\n") for body in parts[2::2]]
+
+    edges = [_edge_lines(lines, "top") + _edge_lines(lines, "bottom") for lines in pages]
+    counts = Counter(key for edge in edges for key in {key for _, key in edge if key[2]})
+    threshold = max(_BOILERPLATE_MIN_PAGES, math.ceil(_BOILERPLATE_MIN_SHARE * len(pages)))
+    frequent = {k for k, n in counts.items() if n >= threshold}
+
+    spans: dict[tuple, dict] = {}
+    kept_pages = []
+    for number, lines, edge in zip(numbers, pages, edges):
+        dropped = set()
+        for i, key in edge:
+            if key not in frequent or i in dropped:
+                continue
+            dropped.add(i)
+            span = spans.setdefault(key, {"position": key[0], "text": lines[i].strip(), "pages": []})
+            if number not in span["pages"]:
+                span["pages"].append(number)
+        kept_pages.append("\n".join(line for i, line in enumerate(lines) if i not in dropped).strip())
+
+    text = (parts[0].strip() + "\n\n" + "\n\n".join(p for p in kept_pages if p)).strip()
+    removed = {
+        "page_markers": len(numbers),
+        "lines": sum(len(span["pages"]) for span in spans.values()),
+        "chars": len(raw) - len(text),
+        "spans": sorted(spans.values(), key=lambda span: (span["position"] != "top", span["pages"][0])),
+    }
+    return text, removed
+
 # -------------------------
 # Table reinsertion
 # -------------------------
-def reinsert_tables_into_markdown(md: str, pdf_tables: list) -> str:
+def reinsert_tables_into_markdown(md: str, pdf_tables: list, render=None) -> str:
     """Reinsert pdfplumber tables into model-generated markdown using
     section-level structural matching.
 
+    render – table dict → the markdown inserted for it; defaults to its rows
+    as a pipe table.
+
     Strategy:
     1. Group tables by their section_heading (set by extract_tables_from_pdf).
     2. Scan the model output for markdown headings and fuzzy-match each source
@@ -601,6 +1177,8 @@ def reinsert_tables_into_markdown(md: str, pdf_tables: list) -> str:
 
     if not pdf_tables:
         return "\n".join(lines)
+    if render is None:
+        render = lambda td: _table_to_markdown(td["rows"])
 
     # --- inner helpers ---
 
@@ -676,11 +1254,7 @@ def reinsert_tables_into_markdown(md: str, pdf_tables: list) -> str:
                 break
 
         # Collect non-empty table markdown blocks in document order
-        table_mds = [
-            _table_to_markdown(td["rows"])
-            for td in tables_for_section
-            if _table_to_markdown(td["rows"])
-        ]
+        table_mds = [tmd for tmd in map(render, tables_for_section) if tmd]
         if table_mds:
             insertion_plan.append((section_end, table_mds))
 
@@ -696,7 +1270,7 @@ def reinsert_tables_into_markdown(md: str, pdf_tables: list) -> str:
 
     # --- append tables that had no section match at the end ---
     for td in unmatched:
-        tmd = _table_to_markdown(td["rows"])
+        tmd = render(td)
         if tmd:
             lines.append("")
             lines.extend(tmd.splitlines())
@@ -705,6 +1279,51 @@ def reinsert_tables_into_markdown(md: str, pdf_tables: list) -> str:
     return "\n".join(lines)
 
 
+
+
+# A placeholder line as the model may decorate it: list marker, bold, code
+_DECORATED_PLACEHOLDER_RE = re.compile(r"^[ \t\-*>#\d.)`_]*?(TABLE_PLACEHOLDER_\d+)[ \t*`_.]*$", re.MULTILINE)
+
+
+def resolve_table_placeholders(md: str, pdf_tables: list) -> str:
+    """Tidy the TABLE_PLACEHOLDER_N lines of model output for pdf_tables.
+
+    Placeholders the model decorated (list markers, bold) become bare lines
+    again, unknown and repeated ones are dropped, and the placeholders of
+    tables the model left out are put back by section heading, or at the
+    end (see reinsert_tables_into_markdown).
+    """
+    seen: set[int] = set()
+
+    def keep(m: re.Match) -> str:
+        n = int(m.group(1)[len("TABLE_PLACEHOLDER_"):])
+        if not 1 <= n <= len(pdf_tables) or n in seen:
+            return ""
+        seen.add(n)
+        return m.group(1)
+
+    md = _DECORATED_PLACEHOLDER_RE.sub(keep, md)
+    missing = [td for n, td in enumerate(pdf_tables, start=1) if n not in seen]
+    if not missing:
+        return md
+    numbers = {id(td): n for n, td in enumerate(pdf_tables, start=1)}
+    return reinsert_tables_into_markdown(md, missing, render=lambda td: f"TABLE_PLACEHOLDER_{numbers[id(td)]}")
+
+
+def expand_table_placeholders(md: str, pdf_tables: list) -> str:
+    """Replace TABLE_PLACEHOLDER_N lines with table N as a markdown pipe
+    table, for Markdown output; unknown placeholders are left as they are."""
+    if not pdf_tables:
+        return md
+
+    def expand(m: re.Match) -> str:
+        n = int(m.group(1)[len("TABLE_PLACEHOLDER_"):])
+        if not 1 <= n <= len(pdf_tables):
+            return m.group(0)
+        return _table_to_markdown(pdf_tables[n - 1]["rows"])
+
+    return _PLACEHOLDER_LINE_RE.sub(expand, md)
+
 # -------------------------
 # User-facing label normalization
 # -------------------------
@@ -727,61 +1346,633 @@ def normalize_user_facing_labels(md: str) -> str:
 # -------------------------
 _RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
 
+# Running token totals for every LLM call made by this process (batch throughput)
+_usage_lock = threading.Lock()
+_usage_totals = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+
+
+def _record_usage(resp, estimated_tokens: int = None) -> dict:
+    """Add a response's token usage to the process-wide totals, and correct
+    the rate limiter's reservation of estimated_tokens (if given).  Returns
+    {'input_tokens', 'output_tokens', 'cached_tokens'} (None when the
+    response has no usage); cached_tokens is the part of the input served
+    from the provider's prompt cache."""
+    usage = getattr(resp, "usage", None)
+    total = None
+    tokens = {"input_tokens": None, "output_tokens": None, "cached_tokens": None}
+    with _usage_lock:
+        _usage_totals["calls"] += 1
+        if usage is not None:
+            input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", 0) or 0
+            output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", 0) or 0
+            # Responses API: input_tokens_details; chat completions: prompt_tokens_details
+            details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", 0) or 0
+            _usage_totals["input_tokens"] += input_tokens
+            _usage_totals["output_tokens"] += output_tokens
+            _usage_totals["cached_tokens"] += cached_tokens
+            total = input_tokens + output_tokens
+            tokens = {"input_tokens": input_tokens, "output_tokens": output_tokens, "cached_tokens": cached_tokens}
+    limiter = get_rate_limiter()
+    if limiter is not None and estimated_tokens is not None:
+        limiter.settle(estimated_tokens, total)
+    return tokens
+
+
+def usage_totals() -> dict:
+    """Return a snapshot of the token totals recorded by _record_usage."""
+    with _usage_lock:
+        return dict(_usage_totals)
+
+
+def prompt_cache_summary(spans: list) -> dict:
+    """Provider prompt-cache use over the "llm" and "vision" spans given:
+    input and cached tokens per call kind and overall, with hit rates."""
+    summary = {}
+    for entry in spans:
+        if entry["name"] not in ("llm", "vision") or not entry.get("input_tokens"):
+            continue
+        for kind in (entry.get("kind") or entry["name"], "total"):
+            t = summary.setdefault(kind, {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+            t["calls"] += 1
+            t["input_tokens"] += entry["input_tokens"]
+            t["cached_tokens"] += entry.get("cached_tokens") or 0
+    for t in summary.values():
+        t["hit_rate"] = prompts.cache_hit_rate(t["input_tokens"], t["cached_tokens"])
+    return summary
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Delay before retrying after a transient error.  A 429 also pauses the
+    shared rate limiter, so every worker backs off, not just this one.
+    Callers wait inside a _retry_span."""
+    delay = retry_delay(attempt, error, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+    limiter = get_rate_limiter()
+    if isinstance(error, RateLimitError) and limiter is not None:
+        limiter.pause(delay)
+    print(f"  Retry {attempt}/{MAX_RETRIES} after {type(error).__name__}, waiting {delay:.1f}s...")
+    return delay
+
+
+def _retry_span(attempt: int, error: Exception):
+    """Instrumentation span around a backoff wait."""
+    return instrument.span("retry_wait", attempt=attempt, error=type(error).__name__)
+
+
+def _settle(resp, attempt: int, estimated_tokens: int):
+    """Record a successful response's usage; annotates the caller's span (an
+    "llm" or "vision" span), if any.  Returns resp."""
+    instrument.annotate(attempts=attempt, **_record_usage(resp, estimated_tokens))
+    return resp
+
+
+def _create_with_retry(create, estimated_tokens: int):
+    """Call create() under the rate limiter, retrying transient errors with
+    jittered backoff (honoring Retry-After).  Returns the response."""
+    limiter = get_rate_limiter()
+    for attempt in range(1, MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(estimated_tokens)
+        try:
+            resp = create()
+        except _RETRYABLE as e:
+            if attempt == MAX_RETRIES:
+                raise
+            with _retry_span(attempt, e):
+                time.sleep(_backoff(attempt, e))
+            continue
+        return _settle(resp, attempt, estimated_tokens)
 
-def _call_with_retry(client: OpenAI, model: str, prompt: str) -> str:
-    """Call the OpenAI responses API with exponential backoff on transient errors."""
-    delay = RETRY_BASE_DELAY
+
+async def _acreate_with_retry(create, estimated_tokens: int):
+    """Async counterpart of _create_with_retry; create() returns an awaitable."""
+    limiter = get_rate_limiter()
     for attempt in range(1, MAX_RETRIES + 1):
+        if limiter is not None:
+            await limiter.aacquire(estimated_tokens)
         try:
-            resp = client.responses.create(model=model, input=prompt)
-            return resp.output_text.strip()
+            resp = await create()
         except _RETRYABLE as e:
             if attempt == MAX_RETRIES:
                 raise
-            print(f"  Retry {attempt}/{MAX_RETRIES} after {type(e).__name__}, waiting {delay}s...")
-            time.sleep(delay)
-            delay *= 2
+            with _retry_span(attempt, e):
+                await asyncio.sleep(_backoff(attempt, e))
+            continue
+        return _settle(resp, attempt, estimated_tokens)
+
+
+def _call_with_retry(client: OpenAI, model: str, prompt: str) -> str:
+    """Call the OpenAI responses API under the rate limiter, with backoff on
+    transient errors."""
+    resp = _create_with_retry(lambda: client.responses.create(model=model, input=prompt), estimate_tokens(prompt))
+    return resp.output_text.strip()
+
+
+class _CacheEntry:
+    """A lookup in the content-addressed LLM cache (llm_cache.py), shared by
+    the sync and async cached calls.
+
+    key_parts must capture everything the prompt is built from; the model is
+    always part of the key.  cached is what the "llm" span records: True for
+    a hit, False for a miss, None without a cache.
+    """
+
+    def __init__(self, model: str, key_parts: tuple):
+        self.cache = get_llm_cache()
+        self.key = cache_key(model, *key_parts) if self.cache is not None else None
+        self.hit = self.cache.get(self.key) if self.cache is not None else None
+        self.cached = None if self.cache is None else self.hit is not None
+
+    def store(self, output: str) -> None:
+        if self.cache is not None:
+            self.cache.put(self.key, output)
+
+
+def _call_cached(client: OpenAI, model: str, prompt: str, key_parts: tuple) -> str:
+    """_call_with_retry behind the LLM cache (see _CacheEntry)."""
+    with instrument.span("llm", kind=key_parts[0], model=model, cached=None) as s:
+        entry = _CacheEntry(model, key_parts)
+        s["cached"] = entry.cached
+        if entry.hit is not None:
+            return entry.hit
+        output = _call_with_retry(client, model, prompt)
+        entry.store(output)
+        return output
+
+
+def _stream_event(event, stats: dict, estimated_tokens: int) -> str | None:
+    """Handle one streamed responses API event: returns its text delta, if
+    it is one; records the usage from the completion event into stats."""
+    if event.type == "response.output_text.delta":
+        return event.delta
+    if event.type == "response.completed":
+        stats.update(_record_usage(event.response, estimated_tokens))
+    return None
+
+
+def _stream_with_retry(client: OpenAI, model: str, prompt: str, stats: dict = None):
+    """Streaming counterpart of _call_with_retry: yields output text deltas.
+
+    Transient errors are retried with the same backoff, but only until the
+    first delta has been yielded — after that the consumer has already seen
+    partial output, so the error is raised instead.  If given, stats is
+    filled with the attempt count and the response's token usage.
+    """
+    stats = stats if stats is not None else {}
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(prompt)
+    for attempt in range(1, MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(estimated)
+        stats["attempts"] = attempt
+        started = False
+        try:
+            for event in client.responses.create(model=model, input=prompt, stream=True):
+                delta = _stream_event(event, stats, estimated)
+                if delta is not None:
+                    started = True
+                    yield delta
+            return
+        except _RETRYABLE as e:
+            if started or attempt == MAX_RETRIES:
+                raise
+            with _retry_span(attempt, e):
+                time.sleep(_backoff(attempt, e))
+
+
+class _StreamRecord:
+    """Bookkeeping for one cached, streamed LLM call, shared by _stream_cached
+    and _astream_cached: the cache lookup, the deltas seen and the "llm"
+    instrumentation record.  Not a span() block, as the consumer runs
+    between the stream's yields."""
+
+    def __init__(self, model: str, key_parts: tuple):
+        self.model = model
+        self.kind = key_parts[0]
+        self.entry = _CacheEntry(model, key_parts)
+        self.parts: list[str] = []
+        self.stats: dict = {}
+        self.t0 = time.monotonic()
+        if self.entry.hit is not None:
+            instrument.record("llm", 0.0, kind=self.kind, model=model, cached=True, streamed=True)
+
+    def add(self, delta: str) -> None:
+        if not self.parts:
+            self.stats["first_token_seconds"] = round(time.monotonic() - self.t0, 3)
+        self.parts.append(delta)
+
+    def fail(self, error: Exception) -> None:
+        self.stats["error"] = type(error).__name__
+
+    def finish(self) -> None:
+        instrument.record(
+            "llm", time.monotonic() - self.t0, kind=self.kind, model=self.model, cached=self.entry.cached,
+            streamed=True, **self.stats,
+        )
+
+    def store(self) -> None:
+        """Cache the completed stream like a _call_cached result."""
+        self.entry.store("".join(self.parts).strip())
+
+
+def _stream_cached(client: OpenAI, model: str, prompt: str, key_parts: tuple):
+    """_stream_with_retry behind the LLM cache.  A cache hit is yielded as a
+    single delta; a completed stream is stored like a _call_cached result."""
+    rec = _StreamRecord(model, key_parts)
+    if rec.entry.hit is not None:
+        yield rec.entry.hit
+        return
+    try:
+        for delta in _stream_with_retry(client, model, prompt, rec.stats):
+            rec.add(delta)
+            yield delta
+    except Exception as e:
+        rec.fail(e)
+        raise
+    finally:
+        rec.finish()
+    rec.store()
+
+
+async def _acall_with_retry(client: AsyncOpenAI, model: str, prompt: str) -> str:
+    """Async counterpart of _call_with_retry; waits without blocking the
+    event loop."""
+    resp = await _acreate_with_retry(lambda: client.responses.create(model=model, input=prompt), estimate_tokens(prompt))
+    return resp.output_text.strip()
+
+
+async def _acall_cached(client: AsyncOpenAI, model: str, prompt: str, key_parts: tuple) -> str:
+    """Async counterpart of _call_cached."""
+    with instrument.span("llm", kind=key_parts[0], model=model, cached=None) as s:
+        entry = _CacheEntry(model, key_parts)
+        s["cached"] = entry.cached
+        if entry.hit is not None:
+            return entry.hit
+        output = await _acall_with_retry(client, model, prompt)
+        entry.store(output)
+        return output
+
+
+async def _astream_with_retry(client: AsyncOpenAI, model: str, prompt: str, stats: dict = None):
+    """Async counterpart of _stream_with_retry."""
+    stats = stats if stats is not None else {}
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(prompt)
+    for attempt in range(1, MAX_RETRIES + 1):
+        if limiter is not None:
+            await limiter.aacquire(estimated)
+        stats["attempts"] = attempt
+        started = False
+        try:
+            async for event in await client.responses.create(model=model, input=prompt, stream=True):
+                delta = _stream_event(event, stats, estimated)
+                if delta is not None:
+                    started = True
+                    yield delta
+            return
+        except _RETRYABLE as e:
+            if started or attempt == MAX_RETRIES:
+                raise
+            with _retry_span(attempt, e):
+                await asyncio.sleep(_backoff(attempt, e))
+
+
+async def _astream_cached(client: AsyncOpenAI, model: str, prompt: str, key_parts: tuple):
+    """Async counterpart of _stream_cached."""
+    rec = _StreamRecord(model, key_parts)
+    if rec.entry.hit is not None:
+        yield rec.entry.hit
+        return
+    try:
+        async for delta in _astream_with_retry(client, model, prompt, rec.stats):
+            rec.add(delta)
+            yield delta
+    except Exception as e:
+        rec.fail(e)
+        raise
+    finally:
+        rec.finish()
+    rec.store()
+
+
+def iter_completed_lines(deltas):
+    """Regroup a stream of text deltas into complete lines (without the
+    trailing newline).  The final unterminated line is yielded at the end."""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+async def aiter_completed_lines(deltas):
+    """Async counterpart of iter_completed_lines."""
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
 
 
 # -------------------------
-# LLM: conversion
+# Chunking (long documents)
 # -------------------------
-def convert_to_protocol_markdown(client: OpenAI, contract: str, cleaned_text: str) -> str:
-    if len(cleaned_text) > MAX_INPUT_CHARS:
-        cleaned_text = cleaned_text[:MAX_INPUT_CHARS] + "\n\n[TRUNCATED: input exceeded MAX_INPUT_CHARS]\n"
+def _chunk_cut(lines: list, offsets: list, lo: int, hi: int) -> int | None:
+    """Pick the line index to start the next chunk at, among lines starting
+    at character offsets in (lo, hi].  Prefers a heading that opens a
+    paragraph, then any paragraph start, then any line."""
+    candidates = [i for i in range(1, len(lines)) if lo < offsets[i] <= hi]
+    paragraph_starts = [i for i in candidates if not lines[i - 1].strip() and lines[i].strip()]
+    headings = [i for i in paragraph_starts if _looks_like_heading(lines[i])]
+    for preferred in (headings, paragraph_starts, candidates):
+        if preferred:
+            return preferred[-1]
+    return None
+
+
+def split_source_chunks(raw_text: str, cleaned_text: str, max_chars: int = CHUNK_CHARS) -> list[str]:
+    """Split a document into cleaned chunks of at most ~max_chars for
+    conversion.
+
+    Documents whose cleaned text fits in max_chars are returned unchanged as
+    a single chunk.  Otherwise the raw extracted text is cut at section
+    headings where possible (clean_text joins lines, so headings are only
+    recognisable before cleaning) and each piece is cleaned separately.
+    """
+    if len(cleaned_text) <= max_chars:
+        return [cleaned_text]
+
+    lines = raw_text.split("\n")
+    offsets = []
+    pos = 0
+    for line in lines:
+        offsets.append(pos)
+        pos += len(line) + 1
+
+    chunks: list[str] = []
+    start = 0
+    while start < len(lines):
+        if pos - offsets[start] <= max_chars:
+            end = len(lines)
+        else:
+            lo = offsets[start] + max_chars // 2
+            cut = _chunk_cut(lines, offsets, lo, offsets[start] + max_chars)
+            if cut is None or cut <= start:
+                # A single very long line: take it whole
+                cut = start + 1
+            end = cut
+        # Same as clean_text for text without table placeholders
+        chunk = clean_text_preserving_placeholders("\n".join(lines[start:end]))
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    return chunks
+
+
+_NUMBERED_ITEM_RE = re.compile(r"^(\d+)([.)]\s+)")
+
+
+class _ChunkMerger:
+    """Joins per-chunk protocol markdown into one document, part by part.
+
+    Each chunk was converted on its own, so the merge drops repeated title
+    (H1) headings and per-chunk review checklists (finalize_protocol_md
+    appends one for the whole document), drops a heading that only repeats
+    the section the previous chunk ended in, and continues that section's
+    step numbering across the join.
+    """
+
+    def __init__(self):
+        self._title = None
+        self._heading = None
+        self._last_number = 0
+        self._parts = 0
+
+    def add(self, part_md: str) -> str:
+        """Return the merged text for the next part (without separator)."""
+        lines = part_md.strip().split("\n")
+        first = self._parts == 0
+        self._parts += 1
+
+        out: list[str] = []
+        in_checklist = False
+        continuing = not first
+        first_heading = not first
+        for line in lines:
+            if line.startswith("#"):
+                heading = " ".join(line.split())
+                in_checklist = heading.lower() == "## review checklist"
+                if in_checklist:
+                    continue
+                if first_heading:
+                    # The chunk's first headings, even after blank lines or a
+                    # preamble the model added
+                    if heading == self._title:
+                        continue
+                    if heading == self._heading:
+                        continue  # same section as the previous chunk ended in
+                    first_heading = False
+                if heading.startswith("# ") and self._title is None:
+                    self._title = heading
+                self._heading = heading
+                self._last_number = 0
+                continuing = False
+                out.append(line)
+                continue
+            if in_checklist:
+                continue
+            if not line.strip() and (not out or not out[-1].strip()):
+                continue  # leading blanks, or a blank left by a dropped heading
+            m = _NUMBERED_ITEM_RE.match(line)
+            if m:
+                if continuing:
+                    number = self._last_number + 1
+                    line = f"{number}{m.group(2)}{line[m.end():]}"
+                else:
+                    number = int(m.group(1))
+                self._last_number = number
+            out.append(line)
+        return "\n".join(out).strip()
+
+
+def merge_protocol_chunks(parts: list[str]) -> str:
+    """Merge per-chunk conversion outputs (see _ChunkMerger).  A single part
+    is returned unchanged."""
+    if len(parts) == 1:
+        return parts[0]
+    merger = _ChunkMerger()
+    merged = [merger.add(part) for part in parts]
+    return "\n\n".join(text for text in merged if text)
+
+
+def merge_flag_reports(reports: list[str]) -> str:
+    """Merge per-chunk flag reports section by section, keeping section order
+    and dropping "None detected" placeholders when another chunk found
+    something."""
+    if len(reports) == 1:
+        return reports[0]
+    preamble: list[str] = []
+    sections: dict[str, list[str]] = {}
+    for report in reports:
+        heading = None
+        for line in report.strip().split("\n"):
+            if line.startswith("## "):
+                heading = line.strip()
+                sections.setdefault(heading, [])
+                continue
+            if heading is None:
+                if not sections and line.strip() and line not in preamble:
+                    preamble.append(line)
+                continue
+            body = sections[heading]
+            if line.strip() and line in body:
+                continue
+            body.append(line)
 
-    prompt = f"""
-You are a careful scientific editor.
+    out: list[str] = preamble[:]
+    for heading, body in sections.items():
+        content = [line for line in body if line.strip()]
+        findings = [line for line in content if not re.fullmatch(r"[-*\s]*none detected\.?", line.strip(), re.I)]
+        if out:
+            out.append("")
+        out.append(heading)
+        out.append("")
+        out.extend(findings or content[:1] or ["None detected"])
+    return "\n".join(out).strip() + "\n"
 
-Follow the protocol output contract STRICTLY.
-Do not add or invent scientific content.
-Preserve all numbers/units/times/temperatures exactly.
-If something is unclear, write "[CHECK]" rather than guessing.
 
-STEP COMPLETENESS: Every numbered step must begin with a verb or subject and be a fully self-contained sentence. If the source text for a step begins mid-sentence, reconstruct the full sentence before outputting it. Never output a step that begins with a lowercase letter, a conjunction (such as and, or, but, so, then, while), or a word that implies a preceding clause.
+# -------------------------
+# LLM: conversion
+# -------------------------
+def _convert_prompt(contract: str, cleaned_text: str, part: tuple[int, int] = None) -> tuple[str, tuple]:
+    """Build the conversion prompt; returns (prompt, cache key parts).
 
-SECTION HEADINGS: Output every section heading from the source document as its own standalone markdown heading using the exact wording from the source. This includes passage labels such as "Passage 1", "Passage 2", "Passage 3-5" and any other named or numbered subsections — each must appear as a separate heading and must not be merged with adjacent section titles or wrapped in parentheses as part of another heading. Do not reorder or rename any section. Do not add any section headings that do not exist in the source document, including headings such as "Objective", "Procedure", or "Materials" unless those exact words appear as headings in the source.
+    part – (index, count), 1-based, when cleaned_text is one chunk of a longer
+    document (see split_source_chunks).
+    """
+    if len(cleaned_text) > MAX_INPUT_CHARS:
+        cleaned_text = cleaned_text[:MAX_INPUT_CHARS] + "\n\n[TRUNCATED: input exceeded MAX_INPUT_CHARS]\n"
 
-SOURCE FIDELITY: Do not add any sections, content, checklists, flags, or commentary that does not exist in the source document. The output must contain only what is present in the source. Do not add review checklists, parameter summaries, missing-parameter analysis, unsupported-claims sections, or any other AI-generated content.
+    # Table placeholder mode (see extract_pdf_content) is recognised from the text
+    placeholders = _PLACEHOLDER_LINE_RE.search(cleaned_text) is not None
+    prompt = prompts.convert_prompt(contract, cleaned_text, part, placeholders)
+    key_parts = ("convert", CONVERT_PROMPT_VERSION, contract, cleaned_text)
+    if part is not None:
+        key_parts += ("part", *part)
+    return prompt, key_parts
 
-REAGENT DEFINITIONS: When a protocol step references a named reagent mixture (e.g. "recommended growth medium", "complete medium", or any reagent given a proper name), include the full composition of that mixture either inline in that step as a sub-bullet or in a Materials section at the top of the document. Do not reference a named mixture without defining it somewhere in the document.
 
-NUMBERED STEPS: Output every procedural step as a markdown numbered list item using the format "1. text", "2. text", and so on. Every procedural step in the source must appear as a numbered list item in the output. Do not let any step fall through to plain text.
+def convert_to_protocol_markdown(client: OpenAI, contract: str, cleaned_text: str) -> str:
+    prompt, key_parts = _convert_prompt(contract, cleaned_text)
+    return _call_cached(client, MODEL_CONVERT, prompt, key_parts)
 
-LIST NUMBERING: Whenever a new section or subsection heading appears, any numbered list that follows must restart at 1. Each procedural section is independent and must have its own numbering starting from 1.
 
-TABLES: Do not reproduce any tables in the output. Instead, read the data from each table in the source and embed the relevant values directly into the protocol step they belong to. For example, if a table lists wash volumes by system type, incorporate those volumes into the wash step as inline text: 'Wash with DPBS (2-layer: 80 mL, 3-layer: 120 mL, 10-layer: 400 mL, 13-layer: 520 mL per system)'. Every value from every table must appear somewhere in the output — do not omit table data.
+def convert_to_protocol_markdown_stream(client: OpenAI, contract: str, cleaned_text: str):
+    """Streaming variant of convert_to_protocol_markdown: yields text deltas.
 
-TABLE PLACEMENT: Embed table values into the step that logically precedes or introduces that table in the source document. If a table appears after step 5, its values belong in step 5 or as a sub-note immediately after step 5.
+    "".join() of the deltas, stripped, equals the non-streaming result.
+    """
+    prompt, key_parts = _convert_prompt(contract, cleaned_text)
+    yield from _stream_cached(client, MODEL_CONVERT, prompt, key_parts)
+
+
+def convert_chunks(client: OpenAI, contract: str, chunks: list[str]) -> list[str]:
+    """Convert the chunks from split_source_chunks concurrently; returns the
+    per-chunk markdown in order, for merge_protocol_chunks."""
+    if len(chunks) == 1:
+        return [convert_to_protocol_markdown(client, contract, chunks[0])]
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks)), thread_name_prefix="chunk") as pool:
+        futures = [
+            pool.submit(instrument.bind(_call_cached), client, MODEL_CONVERT, *_convert_prompt(contract, chunk, (i, len(chunks))))
+            for i, chunk in enumerate(chunks, start=1)
+        ]
+        return [f.result() for f in futures]
 
---- CONTRACT ---
-{contract}
 
---- INPUT TEXT ---
-{cleaned_text}
-""".strip()
+def convert_chunks_stream(client: OpenAI, contract: str, chunks: list[str], parts: list = None):
+    """Streaming variant of merge_protocol_chunks(convert_chunks(...)).
 
-    return _call_with_retry(client, MODEL_CONVERT, prompt)
+    A single chunk is streamed as it is generated.  Multiple chunks are
+    converted concurrently and each merged part is yielded as soon as it and
+    all chunks before it are done.  The raw per-chunk outputs are appended to
+    parts (if given) for generate_chunked_flags_md.
+    """
+    if len(chunks) == 1:
+        deltas = []
+        for delta in convert_to_protocol_markdown_stream(client, contract, chunks[0]):
+            deltas.append(delta)
+            yield delta
+        if parts is not None:
+            parts.append("".join(deltas).strip())
+        return
+    merger = _ChunkMerger()
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks)), thread_name_prefix="chunk") as pool:
+        futures = [
+            pool.submit(instrument.bind(_call_cached), client, MODEL_CONVERT, *_convert_prompt(contract, chunk, (i, len(chunks))))
+            for i, chunk in enumerate(chunks, start=1)
+        ]
+        emitted = False
+        for future in futures:
+            part_md = future.result()
+            if parts is not None:
+                parts.append(part_md)
+            text = merger.add(part_md)
+            if text:
+                yield ("\n\n" if emitted else "") + text
+                emitted = True
+
+
+async def aconvert_to_protocol_markdown_stream(client: AsyncOpenAI, contract: str, cleaned_text: str):
+    """Async counterpart of convert_to_protocol_markdown_stream."""
+    prompt, key_parts = _convert_prompt(contract, cleaned_text)
+    async for delta in _astream_cached(client, MODEL_CONVERT, prompt, key_parts):
+        yield delta
+
+
+async def _abounded(semaphore: asyncio.Semaphore, fn, *args):
+    """await fn(*args) once semaphore admits it: the async paths' equivalent
+    of the sync paths' CHUNK_WORKERS thread pools."""
+    async with semaphore:
+        return await fn(*args)
+
+
+async def aconvert_chunks_stream(client: AsyncOpenAI, contract: str, chunks: list[str], parts: list = None):
+    """Async counterpart of convert_chunks_stream.  At most CHUNK_WORKERS
+    chunks are converted at a time, as in the sync path."""
+    if len(chunks) == 1:
+        deltas = []
+        async for delta in aconvert_to_protocol_markdown_stream(client, contract, chunks[0]):
+            deltas.append(delta)
+            yield delta
+        if parts is not None:
+            parts.append("".join(deltas).strip())
+        return
+    semaphore = asyncio.Semaphore(CHUNK_WORKERS)
+    tasks = [
+        asyncio.ensure_future(
+            _abounded(semaphore, _acall_cached, client, MODEL_CONVERT, *_convert_prompt(contract, chunk, (i, len(chunks))))
+        )
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+    try:
+        merger = _ChunkMerger()
+        emitted = False
+        for task in tasks:
+            part_md = await task
+            if parts is not None:
+                parts.append(part_md)
+            text = merger.add(part_md)
+            if text:
+                yield ("\n\n" if emitted else "") + text
+                emitted = True
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 def finalize_protocol_md(protocol_md: str) -> str:
@@ -794,50 +1985,53 @@ def finalize_protocol_md(protocol_md: str) -> str:
 # LLM: flagging (second pass)
 # -------------------------
 def generate_flags_md(client: OpenAI, cleaned_text: str, protocol_md: str) -> str:
-    # Keep the inputs bounded
-    if len(cleaned_text) > 60_000:
-        cleaned_text = cleaned_text[:60_000] + "\n\n[TRUNCATED]\n"
-    if len(protocol_md) > 60_000:
-        protocol_md = protocol_md[:60_000] + "\n\n[TRUNCATED]\n"
-
-    prompt = f"""
-You are a scientific QA reviewer. Your job is to flag risk, not to rewrite.
-
-Given:
-1) SOURCE TEXT (from a PDF extraction)
-2) GENERATED PROTOCOL (Markdown)
-
-Return a Markdown report with these sections:
-
-## Critical Parameters Checklist (from the protocol)
-List the key numeric parameters present in the generated protocol (e.g., temperatures, times, volumes, concentrations, rpm/RCF, CO2/O2).
-If a category is not present, say "MISSING".
+    prompt, key_parts = _flag_prompt(cleaned_text, protocol_md)
+    return _call_cached(client, MODEL_FLAG, prompt, key_parts)
+
+
+def generate_chunked_flags_md(client: OpenAI, chunks: list[str], parts: list[str], protocol_md: str) -> str:
+    """Flag a chunked conversion: each source chunk is reviewed against its
+    own converted part, concurrently, and the reports are merged.  A single
+    chunk is flagged against the final protocol_md, as generate_flags_md."""
+    if len(chunks) == 1:
+        return generate_flags_md(client, chunks[0], protocol_md)
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks)), thread_name_prefix="chunk") as pool:
+        futures = [
+            pool.submit(instrument.bind(_call_cached), client, MODEL_FLAG, *_flag_prompt(chunk, part_md))
+            for chunk, part_md in zip(chunks, parts)
+        ]
+        return merge_flag_reports([f.result() for f in futures])
 
-## Potential Missing Parameters (compare to source)
-Identify parameters that appear in the SOURCE TEXT but are missing or unclear in the GENERATED PROTOCOL.
-Only cite items that are supported by the SOURCE TEXT.
 
-## Possible Unsupported Claims
-List any statements in the GENERATED PROTOCOL that are NOT clearly supported by the SOURCE TEXT.
-If none, say "None detected".
+async def agenerate_flags_md(client: AsyncOpenAI, cleaned_text: str, protocol_md: str) -> str:
+    """Async counterpart of generate_flags_md."""
+    prompt, key_parts = _flag_prompt(cleaned_text, protocol_md)
+    return await _acall_cached(client, MODEL_FLAG, prompt, key_parts)
 
-## Step Order / Omission Risks
-Call out any suspected omitted steps or ordering changes.
-If none, say "None detected".
 
-Rules:
-- Be conservative.
-- If unsure, label as "[CHECK]" instead of asserting.
-- Use short bullet points.
+async def agenerate_chunked_flags_md(client: AsyncOpenAI, chunks: list[str], parts: list[str], protocol_md: str) -> str:
+    """Async counterpart of generate_chunked_flags_md (also at most
+    CHUNK_WORKERS calls at a time)."""
+    if len(chunks) == 1:
+        return await agenerate_flags_md(client, chunks[0], protocol_md)
+    semaphore = asyncio.Semaphore(CHUNK_WORKERS)
+    reports = await asyncio.gather(*(
+        _abounded(semaphore, _acall_cached, client, MODEL_FLAG, *_flag_prompt(chunk, part_md))
+        for chunk, part_md in zip(chunks, parts)
+    ))
+    return merge_flag_reports(list(reports))
 
---- SOURCE TEXT ---
-{cleaned_text}
 
---- GENERATED PROTOCOL ---
-{protocol_md}
-""".strip()
+def _flag_prompt(cleaned_text: str, protocol_md: str) -> tuple[str, tuple]:
+    """Build the flagging prompt; returns (prompt, cache key parts)."""
+    # Keep the inputs bounded
+    if len(cleaned_text) > 60_000:
+        cleaned_text = cleaned_text[:60_000] + "\n\n[TRUNCATED]\n"
+    if len(protocol_md) > 60_000:
+        protocol_md = protocol_md[:60_000] + "\n\n[TRUNCATED]\n"
 
-    return _call_with_retry(client, MODEL_FLAG, prompt)
+    prompt = prompts.flag_prompt(cleaned_text, protocol_md)
+    return prompt, ("flag", FLAG_PROMPT_VERSION, cleaned_text, protocol_md)
 
 
 def append_flags_summary(protocol_md: str, flags_md: str) -> str:
@@ -930,6 +2124,15 @@ def _split_table_blocks(table_lines: list) -> list:
     return blocks
 
 
+def _new_docx():
+    """Create an empty Document with the protocol's base styling."""
+    doc = Document()
+    style = doc.styles["Normal"]
+    style.font.name = "Calibri"
+    style.font.size = Pt(11)
+    return doc
+
+
 def md_to_docx(md_text: str, docx_path: Path, pdf_tables: list = None) -> None:
     """Convert a Markdown protocol string to a .docx file with basic formatting.
 
@@ -937,11 +2140,18 @@ def md_to_docx(md_text: str, docx_path: Path, pdf_tables: list = None) -> None:
     When present, TABLE_PLACEHOLDER_N lines are replaced with the corresponding
     pre-extracted table rendered directly from pdfplumber row data.
     """
-    doc = Document()
-    style = doc.styles["Normal"]
-    style.font.name = "Calibri"
-    style.font.size = Pt(11)
+    doc = _new_docx()
+    _render_markdown(doc, md_text, pdf_tables)
+    with instrument.span("docx_write"):
+        doc.save(str(docx_path))
+
+
+def _render_markdown(doc, md_text: str, pdf_tables: list = None) -> None:
+    """Append the rendered Markdown to doc (see md_to_docx).
 
+    Rendering is block-by-block, so rendering two strings that split at a
+    blank line gives the same document as rendering them joined.
+    """
     lines = md_text.splitlines()
     i = 0
     while i < len(lines):
@@ -1008,17 +2218,249 @@ def md_to_docx(md_text: str, docx_path: Path, pdf_tables: list = None) -> None:
         doc.add_paragraph(stripped)
         i += 1
 
-    doc.save(str(docx_path))
-
 
 # -------------------------
 # Main
 # -------------------------
+def _extract_worker(pdf_path: Path, page_workers: int = 1, table_placeholders: bool = False) -> tuple[str, list, float, list]:
+    """Process-pool entry point for --workers mode.
+
+    Returns (raw_text, tables, started_at, spans): the placeholder tables
+    (empty unless table_placeholders; no vision fallback here, as workers
+    make no API calls), started_at so the PDF's elapsed time covers
+    extraction rather than the time it spent queued behind other PDFs, and
+    the extraction's instrumentation spans for its run log.
+    """
+    t0 = time.time()
+    with instrument.recording() as rec:
+        if table_placeholders:
+            raw, tables = extract_pdf_content(pdf_path, None, workers=page_workers, placeholders=True)
+        else:
+            raw, tables = extract_text_from_pdf(pdf_path, None, workers=page_workers), []
+    return raw, tables, t0, rec.raw
+
+
+def process_pdf(
+    pdf_path: Path, client: OpenAI, contract: str, extracted=None, page_workers: int = 1, table_placeholders: bool = False,
+    strip_boilerplate: bool = STRIP_BOILERPLATE,
+) -> dict:
+    """Run the full pipeline for one PDF, writing output/<stem>/ artifacts and
+    run_log.json.  Returns the run log.
+
+    The pipeline is a StageGraph, so stages that only depend on the converted
+    protocol overlap with the flagging call: the debug/draft artifact writes
+    and rendering the flags-free part of the DOCX.  Per-stage timestamps are
+    recorded under "stages" in run_log.json, and finer instrumentation spans
+    (PDF open, per-page analysis, vision and LLM calls, DOCX writes; each with
+    its RSS) under "spans", totalled per span name in "span_totals".
+
+    extracted – optional Future resolving to _extract_worker's result; when
+    given, extraction already ran in a worker process and is not repeated.
+    page_workers – processes used for page-parallel extraction of this PDF.
+    table_placeholders – send tables to the model as TABLE_PLACEHOLDER_N
+    lines and render them into the DOCX from the extracted rows
+    (protocol.md gets them as pipe tables).
+    strip_boilerplate – remove running headers/footers and page markers
+    before cleaning; what was removed is logged under "boilerplate".
+    """
+    t0 = time.time()
+    stem = pdf_path.stem
+    out_dir = OUTPUT_DIR / stem
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    log = {
+        "pdf": pdf_path.name,
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model_convert": MODEL_CONVERT,
+        "model_flag": MODEL_FLAG,
+        "status": "started",
+    }
+    # Tables behind the TABLE_PLACEHOLDER_N lines (table_placeholders only)
+    pdf_tables: list = []
+
+    def _extract(r):
+        nonlocal t0
+        if extracted is not None:
+            raw, tables, t0, spans = extracted.result()
+            instrument.extend(spans)
+            log["started_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t0))
+        elif table_placeholders:
+            raw, tables = extract_pdf_content(pdf_path, client, workers=page_workers, placeholders=True)
+        else:
+            raw, tables = extract_text_from_pdf(pdf_path, client, workers=page_workers), []
+        pdf_tables.extend(tables)
+        if table_placeholders:
+            log["table_placeholders"] = len(pdf_tables)
+        (out_dir / "raw_extracted.txt").write_text(raw, encoding="utf-8")
+        return raw
+
+    def _strip(r):
+        # Page furniture repeated on every page never reaches the model
+        if not strip_boilerplate:
+            return r["extract"]
+        text, log["boilerplate"] = strip_page_boilerplate(r["extract"])
+        return text
+
+    def _clean(r):
+        cleaned = clean_text_preserving_placeholders(r["strip"]) if table_placeholders else clean_text(r["strip"])
+        (out_dir / "cleaned.txt").write_text(cleaned, encoding="utf-8")
+        (out_dir / "cleaned_debug.txt").write_text(cleaned, encoding="utf-8")
+        if len(cleaned) < 500:
+            log["warning"] = "Very low extracted text. PDF may be scanned/image-only."
+        return cleaned
+
+    def _chunk(r):
+        chunks = split_source_chunks(r["strip"], r["clean"])
+        log["chunks"] = len(chunks)
+        return chunks
+
+    def _convert(r):
+        # Long documents are converted chunk-wise in parallel and merged
+        parts = convert_chunks(client, contract, r["chunk"])
+        merged = merge_protocol_chunks(parts)
+        if table_placeholders:
+            merged = resolve_table_placeholders(merged, pdf_tables)
+        return parts, merged
+
+    def _write_model_output(r):
+        (out_dir / "model_output_debug.txt").write_text(r["convert"][1], encoding="utf-8")
+        # Flags-free protocol.md draft; replaced once the flags are in
+        (out_dir / "protocol.md").write_text(expand_table_placeholders(r["finalize"], pdf_tables), encoding="utf-8")
+
+    def _docx_draft(r):
+        # Render the flags-free protocol now; the docx stage appends the flags.
+        # append_flags_summary normalizes labels in the protocol too, so the
+        # draft is rendered from the same normalized text.
+        draft_md = normalize_user_facing_labels(r["finalize"]).strip()
+        doc = _new_docx()
+        _render_markdown(doc, draft_md, pdf_tables)
+        return doc, draft_md
+
+    def _flag(r):
+        flags_md = generate_chunked_flags_md(client, r["chunk"], r["convert"][0], r["finalize"])
+        (out_dir / "flags.md").write_text(flags_md, encoding="utf-8")
+        return flags_md
+
+    def _merge(r):
+        # Append flags into protocol for visibility
+        protocol_with_flags = append_flags_summary(r["finalize"], r["flag"])
+        (out_dir / "protocol.md").write_text(expand_table_placeholders(protocol_with_flags, pdf_tables), encoding="utf-8")
+        return protocol_with_flags
+
+    def _docx(r):
+        # Export to Word — tables are embedded in the markdown, or rendered
+        # from pdf_tables at their placeholders
+        doc, draft_md = r["docx_draft"]
+        final_md = r["merge"]
+        if final_md.startswith(draft_md):
+            _render_markdown(doc, final_md[len(draft_md):], pdf_tables)
+            with instrument.span("docx_write"):
+                doc.save(str(out_dir / "protocol.docx"))
+        else:
+            md_to_docx(final_md, out_dir / "protocol.docx", pdf_tables)
+
+    graph = StageGraph()
+
+    def add_stage(name, fn, deps=()):
+        def run(r):
+            with instrument.span(f"stage.{name}"):
+                return fn(r)
+        graph.add(name, run, deps)
+
+    add_stage("extract", _extract)
+    add_stage("strip", _strip, deps=["extract"])
+    add_stage("clean", _clean, deps=["strip"])
+    add_stage("chunk", _chunk, deps=["strip", "clean"])
+    add_stage("convert", _convert, deps=["chunk"])
+    add_stage("finalize", lambda r: finalize_protocol_md(r["convert"][1]), deps=["convert"])
+    add_stage("flag", _flag, deps=["chunk", "convert", "finalize"])
+    add_stage("write_model_output", _write_model_output, deps=["finalize"])
+    add_stage("docx_draft", _docx_draft, deps=["finalize"])
+    add_stage("merge", _merge, deps=["flag", "write_model_output"])
+    add_stage("docx", _docx, deps=["merge", "docx_draft"])
+
+    try:
+        try:
+            with instrument.recording() as rec:
+                results = graph.run()
+        except StageError as e:
+            raise e.error
+
+        log["status"] = "success"
+        log["raw_chars"] = len(results["extract"])
+        log["cleaned_chars"] = len(results["clean"])
+        log["elapsed_seconds"] = round(time.time() - t0, 2)
+
+        print(f"[OK] {pdf_path.name} -> {out_dir / 'protocol.md'}  ({log['elapsed_seconds']}s)")
+
+    except Exception as e:
+        log["status"] = "error"
+        log["error"] = repr(e)
+        log["elapsed_seconds"] = round(time.time() - t0, 2)
+        print(f"[FAIL] {pdf_path.name} failed: {e!r}")
+
+    log["stages"] = graph.timings
+    log["span_totals"] = rec.summary()
+    log["prompt_cache"] = prompt_cache_summary(rec.raw)
+    log["peak_rss_mb"] = instrument.peak_rss_mb()
+    log["spans"] = rec.spans
+
+    try:
+        (out_dir / "run_log.json").write_text(json.dumps(log, indent=2), encoding="utf-8")
+    except OSError as e:
+        print(f"[WARN] Could not write run_log.json for {pdf_path.name}: {e!r}")
+
+    return log
+
+
+def _run_parallel(
+    pdfs: list, client: OpenAI, contract: str, workers: int, page_workers: int = 1, table_placeholders: bool = False,
+    strip_boilerplate: bool = STRIP_BOILERPLATE,
+) -> list:
+    """Extract PDFs in a process pool and overlap their LLM calls in a thread pool.
+
+    Each PDF's conversion is handed to the thread pool as soon as its
+    extraction finishes, so API round trips for one document overlap with
+    extraction and API calls for the others.
+    """
+    logs = []
+    with ProcessPoolExecutor(max_workers=workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as llm_pool:
+        extract_futures = {
+            cpu_pool.submit(_extract_worker, pdf_path, page_workers, table_placeholders): pdf_path for pdf_path in pdfs
+        }
+        convert_futures = [
+            llm_pool.submit(
+                process_pdf, extract_futures[fut], client, contract, fut,
+                table_placeholders=table_placeholders, strip_boilerplate=strip_boilerplate,
+            )
+            for fut in as_completed(extract_futures)
+        ]
+        for fut in convert_futures:
+            logs.append(fut.result())
+    return logs
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Convert protocol PDFs to Markdown and Word.")
     parser.add_argument("--file", type=Path, help="Path to a single PDF to convert instead of the entire input folder.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of PDFs to process concurrently (default: 1, sequential).")
+    parser.add_argument("--page-workers", type=int, default=1, help="Processes per PDF for page-parallel extraction of large documents (default: 1).")
+    parser.add_argument(
+        "--table-placeholders", action="store_true", default=TABLE_PLACEHOLDERS,
+        help="Send tables to the model as placeholders and render them into the DOCX from the PDF (default: TABLE_PLACEHOLDERS env var).",
+    )
+    parser.add_argument(
+        "--strip-boilerplate", action="store_true", default=STRIP_BOILERPLATE,
+        help="Drop running headers/footers and page markers before conversion (default: STRIP_BOILERPLATE env var).",
+    )
     args = parser.parse_args()
 
+    if args.workers < 1:
+        raise SystemExit("--workers must be at least 1")
+    if args.page_workers < 1:
+        raise SystemExit("--page-workers must be at least 1")
+
     if not CONTRACT_PATH.exists():
         raise SystemExit("Missing contract.md in project root. Create it first.")
 
@@ -1034,7 +2476,12 @@ def main() -> None:
             raise SystemExit("No PDFs found in input_pdfs/. Add PDFs and try again.")
 
     contract = CONTRACT_PATH.read_text(encoding="utf-8")
-    client = OpenAI()
+    # LLM_BACKEND=replay|fake runs offline (see llm_backend.py)
+    try:
+        backend = backend_name()
+        client = make_client()
+    except Exception as e:
+        raise SystemExit(f"LLM backend setup failed: {e}") from e
 
     # Validate API key early to avoid wasting time on PDF extraction
     try:
@@ -1044,65 +2491,55 @@ def main() -> None:
 
     OUTPUT_DIR.mkdir(exist_ok=True)
 
-    print(f"Found {len(pdfs)} PDFs. Batch: convert={MODEL_CONVERT}, flag={MODEL_FLAG}")
-
-    for pdf_path in pdfs:
-        t0 = time.time()
-        stem = pdf_path.stem
-        out_dir = OUTPUT_DIR / stem
-        out_dir.mkdir(parents=True, exist_ok=True)
-
-        log = {
-            "pdf": pdf_path.name,
-            "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "model_convert": MODEL_CONVERT,
-            "model_flag": MODEL_FLAG,
-            "status": "started",
-        }
-
-        try:
-            raw = extract_text_from_pdf(pdf_path, client)
-            (out_dir / "raw_extracted.txt").write_text(raw, encoding="utf-8")
-
-            cleaned = clean_text(raw)
-            (out_dir / "cleaned.txt").write_text(cleaned, encoding="utf-8")
-            (out_dir / "cleaned_debug.txt").write_text(cleaned, encoding="utf-8")
+    print(
+        f"Found {len(pdfs)} PDFs. Batch: convert={MODEL_CONVERT}, flag={MODEL_FLAG}, backend={backend}, "
+        f"workers={args.workers}, table_placeholders={args.table_placeholders}, strip_boilerplate={args.strip_boilerplate}"
+    )
 
-            if len(cleaned) < 500:
-                log["warning"] = "Very low extracted text. PDF may be scanned/image-only."
-
-            protocol_md = convert_to_protocol_markdown(client, contract, cleaned)
-            (out_dir / "model_output_debug.txt").write_text(protocol_md, encoding="utf-8")
-            protocol_md = finalize_protocol_md(protocol_md)
-
-            # Flagging pass (QA)
-            flags_md = generate_flags_md(client, cleaned, protocol_md)
-            (out_dir / "flags.md").write_text(flags_md, encoding="utf-8")
-
-            # Append flags into protocol for visibility
-            protocol_with_flags = append_flags_summary(protocol_md, flags_md)
-            (out_dir / "protocol.md").write_text(protocol_with_flags, encoding="utf-8")
-
-            # Export to Word — tables are now embedded directly in the markdown
-            md_to_docx(protocol_with_flags, out_dir / "protocol.docx", [])
-
-            log["status"] = "success"
-            log["raw_chars"] = len(raw)
-            log["cleaned_chars"] = len(cleaned)
-            log["elapsed_seconds"] = round(time.time() - t0, 2)
-
-            print(f"[OK] {pdf_path.name} -> {out_dir / 'protocol.md'}  ({log['elapsed_seconds']}s)")
-
-        except Exception as e:
-            log["status"] = "error"
-            log["error"] = repr(e)
-            log["elapsed_seconds"] = round(time.time() - t0, 2)
-            print(f"[FAIL] {pdf_path.name} failed: {e!r}")
-
-        try:
-            (out_dir / "run_log.json").write_text(json.dumps(log, indent=2), encoding="utf-8")
-        except OSError as e:
-            print(f"[WARN] Could not write run_log.json for {pdf_path.name}: {e!r}")
+    batch_t0 = time.time()
+    if args.workers > 1 and len(pdfs) > 1:
+        logs = _run_parallel(
+            pdfs, client, contract, args.workers, args.page_workers, args.table_placeholders, args.strip_boilerplate,
+        )
+    else:
+        logs = [
+            process_pdf(
+                pdf_path, client, contract, page_workers=args.page_workers,
+                table_placeholders=args.table_placeholders, strip_boilerplate=args.strip_boilerplate,
+            )
+            for pdf_path in pdfs
+        ]
+    batch_elapsed = time.time() - batch_t0
+
+    minutes = max(batch_elapsed, 1e-6) / 60
+    usage = usage_totals()
+    total_tokens = usage["input_tokens"] + usage["output_tokens"]
+    succeeded = sum(1 for log in logs if log["status"] == "success")
+    print(
+        f"\nThroughput: {len(logs)} PDFs ({succeeded} ok) in {batch_elapsed:.1f}s — "
+        f"{len(logs) / minutes:.2f} PDFs/min, {total_tokens / minutes:,.0f} tokens/min "
+        f"({usage['input_tokens']:,} in / {usage['output_tokens']:,} out, {usage['calls']} calls)"
+    )
+    if usage["cached_tokens"]:
+        print(
+            f"Prompt cache: {usage['cached_tokens']:,} of {usage['input_tokens']:,} input tokens cached "
+            f"({prompts.cache_hit_rate(usage['input_tokens'], usage['cached_tokens']):.0%})"
+        )
+    stripped = [log for log in logs if "boilerplate" in log and "raw_chars" in log]
+    if stripped:
+        removed_chars = sum(log["boilerplate"]["chars"] for log in stripped)
+        raw_chars = sum(log["raw_chars"] for log in stripped)
+        print(
+            f"Boilerplate: {removed_chars:,} of {raw_chars:,} extracted chars stripped before cleaning "
+            f"({removed_chars / max(raw_chars, 1):.0%}, {sum(log['boilerplate']['lines'] for log in stripped):,} lines)"
+        )
+    cache = get_llm_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(
+            f"LLM cache: {stats['hits']} hits / {stats['misses']} misses, "
+            f"{stats['entries']} entries ({stats['bytes'] / (1024 * 1024):.1f} MB) in {cache.path}"
+        )
 
     print("\nDone. Review outputs in output/<pdfname>/{protocol.md, flags.md}")
 
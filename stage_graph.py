@@ -0,0 +1,153 @@
+"""stage_graph.py
+
+A small DAG of named pipeline stages with explicit dependencies.
+
+Each stage is a function of the results dict (stage name -> return value)
+and runs as soon as all of its dependencies have finished, so independent
+stages overlap.  Start/end timestamps are recorded per stage for run logs.
+
+    graph = StageGraph()
+    graph.add("convert", lambda r: convert(...))
+    graph.add("flag", lambda r: flag(r["convert"]), deps=["convert"])
+    graph.add("draft", lambda r: render(r["convert"]), deps=["convert"])
+    results = graph.run()          # threads; or `await graph.arun()` with coroutines
+
+If a stage raises, no further stages are started and StageError is raised
+for the first failure.  run() lets stages already on a thread finish; arun()
+cancels them, and also cancels every running stage if arun() itself is
+cancelled (e.g. on client disconnect or shutdown).
+"""
+
+import asyncio
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+
+class StageError(Exception):
+    """Raised by StageGraph.run/arun when a stage fails."""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+class StageGraph:
+    def __init__(self, on_start=None, on_end=None):
+        """on_start(name) / on_end(name, seconds) are called as stages start
+        and finish (from the thread running the stage in run())."""
+        self._stages: dict[str, tuple] = {}
+        self.results: dict = {}
+        self.timings: dict[str, dict] = {}
+        self._on_start = on_start
+        self._on_end = on_end
+
+    def add(self, name: str, fn, deps=()) -> None:
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage '{name}'")
+        missing = [d for d in deps if d not in self._stages]
+        if missing:
+            # Requiring dependencies to be added first also rules out cycles
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+        self._stages[name] = (fn, tuple(deps))
+
+    def _ready(self, done: set, started: set) -> list[str]:
+        return [
+            name for name, (_, deps) in self._stages.items()
+            if name not in started and all(d in done for d in deps)
+        ]
+
+    def _begin(self, name: str) -> float:
+        self.timings[name] = {"started_at": _now(), "ended_at": None, "seconds": None}
+        if self._on_start is not None:
+            self._on_start(name)
+        return time.monotonic()
+
+    def _end(self, name: str, t0: float) -> None:
+        seconds = round(time.monotonic() - t0, 3)
+        self.timings[name].update(ended_at=_now(), seconds=seconds)
+        if self._on_end is not None:
+            self._on_end(name, seconds)
+
+    def _run_stage(self, name: str):
+        fn, _ = self._stages[name]
+        t0 = self._begin(name)
+        try:
+            return fn(self.results)
+        finally:
+            self._end(name, t0)
+
+    def run(self, max_workers: int = 4) -> dict:
+        """Run all stages on a thread pool; returns the results dict."""
+        done: set = set()
+        started: set = set()
+        failure = None
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+            running = {}
+            while True:
+                if failure is None:
+                    for name in self._ready(done, started):
+                        started.add(name)
+                        # Stages see the caller's context variables (e.g. its span recording)
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._run_stage, name)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    name = running.pop(fut)
+                    try:
+                        self.results[name] = fut.result()
+                        done.add(name)
+                    except Exception as e:
+                        failure = failure or StageError(name, e)
+        if failure is not None:
+            raise failure from failure.error
+        return self.results
+
+    async def _arun_stage(self, name: str):
+        fn, _ = self._stages[name]
+        t0 = self._begin(name)
+        try:
+            return await fn(self.results)
+        finally:
+            self._end(name, t0)
+
+    async def arun(self) -> dict:
+        """Run all stages as asyncio tasks; stage functions must be coroutine
+        functions.  Returns the results dict."""
+        done: set = set()
+        started: set = set()
+        failure = None
+        running = {}
+        try:
+            while failure is None:
+                for name in self._ready(done, started):
+                    started.add(name)
+                    running[asyncio.ensure_future(self._arun_stage(name))] = name
+                if not running:
+                    break
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    try:
+                        self.results[name] = task.result()
+                        done.add(name)
+                    except Exception as e:
+                        failure = failure or StageError(name, e)
+        finally:
+            # Don't leave stages making LLM calls (and publishing events) for a
+            # run nobody is waiting on any more
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        if failure is not None:
+            raise failure from failure.error
+        return self.results